@@ -0,0 +1,431 @@
+import logging
+import os
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARRAYS = ["ids", "indptr", "indices", "weights"]
+TREE_ARRAYS = ["parent", "tin", "tout", "order"]
+
+
+def _gather(indptr: np.ndarray, rows: np.ndarray):
+    """
+    Returns the positions of the CSR entries of the given rows, row after row,
+    along with the number of entries of each row.
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum(), dtype=np.int64), counts
+
+
+class ActivityDAG:
+    """
+    It holds the activity graph (the documents and the edges tables) in flat NumPy
+    arrays instead of a networkx DiGraph:
+
+    - ids: the document id of each node, nodes being numbered in insertion order.
+    - indptr, indices, weights: the edges in compressed sparse row (CSR) format,
+      the children of node i being indices[indptr[i]:indptr[i + 1]].
+
+    A million nodes take a few tens of MB, and the arrays are saved as .npy files
+    that are memory-mapped back, so loading the graph does not copy or parse it.
+
+    Edges can be added incrementally: they are buffered and merged into the CSR
+    arrays on the next query, in a single vectorized pass.
+
+    Subtree queries use the primary-parent forest, where the primary parent of a
+    node is its closest parent (the one with the lowest weight, since weights
+    are distances). Each node gets the interval [tin, tout) of its subtree in a
+    preorder of that forest, so checking whether a node is in a subtree takes two
+    comparisons and listing a subtree is a slice.
+    """
+
+    def __init__(self, ids=None):
+        """
+        Args:
+            ids (array-like): The document ids of the nodes, if any.
+        """
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self._pending_ids = []
+        self._pending_edges = []
+        self._sorter = None
+        self._sorted_ids = None
+        self._tree = None
+        if ids is not None:
+            self.add_nodes(ids)
+
+    @classmethod
+    def from_edges(cls, parents, children, weights=None, ids=None):
+        """
+        Builds the graph from arrays of edges, as found in the edges table.
+
+        Args:
+            parents (array-like): Document id of the parent of each edge.
+            children (array-like): Document id of the child of each edge.
+            weights (array-like): Weight of each edge. Default: 1.0
+            ids (array-like): Document ids of the nodes, including the ones without
+                edges. Default: the nodes of the edges.
+        """
+        dag = cls(ids)
+        dag.add_edges(parents, children, weights)
+        return dag
+
+    @classmethod
+    def from_connection(cls, conn, include_taxonomy: bool = True):
+        """
+        Builds the graph from the documents and edges tables of a psycopg
+        connection.
+
+        Args:
+            conn (psycopg.Connection): Connection to the activity graph database.
+            include_taxonomy (bool): Whether to keep the taxonomy nodes and the
+                edges leading to them.
+        """
+        taxonomy = "(SELECT id FROM documents WHERE is_taxonomy)"
+        where = "" if include_taxonomy else " WHERE NOT is_taxonomy"
+        ids = [row[0] for row in conn.execute(f"SELECT id FROM documents{where}")]
+        query = (
+            "SELECT parent_id, child_id, weight FROM edges "
+            "WHERE parent_id IS NOT NULL AND child_id IS NOT NULL"
+        )
+        if not include_taxonomy:
+            query += f" AND parent_id NOT IN {taxonomy} AND child_id NOT IN {taxonomy}"
+        rows = conn.execute(query).fetchall()
+
+        dag = cls(np.array(ids, dtype=np.int64))
+        dag.add_edges(
+            np.fromiter((row[0] for row in rows), np.int64, len(rows)),
+            np.fromiter((row[1] for row in rows), np.int64, len(rows)),
+            np.fromiter((row[2] for row in rows), np.float32, len(rows)),
+        )
+        logger.info(f"Loaded {dag.num_nodes} nodes and {dag.num_edges} edges.")
+        return dag
+
+    @property
+    def num_nodes(self):
+        self._flush()
+        return len(self.ids)
+
+    @property
+    def num_edges(self):
+        self._flush()
+        return len(self.indices)
+
+    def add_nodes(self, ids):
+        """
+        Adds nodes by document id. Ids already in the graph are ignored.
+        """
+        self._pending_ids.append(np.asarray(ids, dtype=np.int64).ravel())
+
+    def add_edges(self, parents, children, weights=None):
+        """
+        Adds edges by document id, adding their nodes if needed. An edge already in
+        the graph gets the new weight.
+        """
+        parents = np.asarray(parents, dtype=np.int64).ravel()
+        children = np.asarray(children, dtype=np.int64).ravel()
+        if len(parents) != len(children):
+            raise ValueError("parents and children must have the same length.")
+        if weights is None:
+            weights = np.ones(len(parents), dtype=np.float32)
+        weights = np.asarray(weights, dtype=np.float32).ravel()
+        self._pending_ids.append(np.concatenate([parents, children]))
+        self._pending_edges.append((parents, children, weights))
+
+    def _flush(self):
+        if not self._pending_ids:
+            return
+        new_ids = np.unique(np.concatenate(self._pending_ids))
+        self._pending_ids = []
+        new_ids = new_ids[~np.isin(new_ids, self.ids)]
+        if len(new_ids):
+            # new nodes are numbered after the existing ones, so the CSR arrays
+            # only need empty rows for them
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.indptr = np.concatenate(
+                [self.indptr, np.full(len(new_ids), self.indptr[-1])]
+            )
+            self._sorter = None
+            self._tree = None
+
+        if not self._pending_edges:
+            return
+        parents, children, weights = (
+            np.concatenate(arrays) for arrays in zip(*self._pending_edges)
+        )
+        self._pending_edges = []
+        num_nodes = len(self.ids)
+        old_rows = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(self.indptr))
+        rows = np.concatenate([old_rows, self.index(parents)])
+        cols = np.concatenate([self.indices, self.index(children)])
+        weights = np.concatenate([self.weights, weights])
+
+        # sort by (parent, child) and keep the last weight given to each edge
+        keys = rows * num_nodes + cols
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        order = order[last]
+
+        self.indices = cols[order]
+        self.weights = weights[order]
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[order], minlength=num_nodes), out=self.indptr[1:])
+        self._tree = None
+
+    def index(self, ids):
+        """
+        Maps document ids to node indices.
+
+        Raises:
+            KeyError: If an id is not in the graph.
+        """
+        if self._pending_ids:
+            self._flush()
+        if self._sorter is None:
+            self._sorter = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = self.ids[self._sorter]
+        ids = np.asarray(ids, dtype=np.int64)
+        sorted_ids = self._sorted_ids
+        positions = np.searchsorted(sorted_ids, ids)
+        positions = np.minimum(positions, len(sorted_ids) - 1)
+        found = (
+            sorted_ids[positions] == ids
+            if len(sorted_ids)
+            else np.zeros_like(ids, bool)
+        )
+        if not np.all(found):
+            raise KeyError(f"Unknown ids: {np.unique(ids[~found])[:10].tolist()}")
+        return self._sorter[positions]
+
+    def children(self, node_id):
+        """
+        Returns the document ids of the children of a node and the edge weights.
+        """
+        i = self.index(node_id)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.ids[self.indices[start:end]], self.weights[start:end]
+
+    def transpose(self):
+        """
+        Returns the graph with every edge reversed.
+        """
+        self._flush()
+        rows = np.repeat(np.arange(len(self.ids), dtype=np.int64), np.diff(self.indptr))
+        dag = ActivityDAG(self.ids)
+        dag.add_edges(self.ids[self.indices], self.ids[rows], self.weights)
+        return dag
+
+    def connected_components(self):
+        """
+        Labels the weakly connected components of the graph.
+
+        Every node points to the smallest node it is known to be connected to.
+        Each round hooks the representatives of the two ends of every edge onto
+        the smaller of the two, then shortcuts the pointers until each node points
+        to its representative, all over the whole edge array at once. It takes a
+        few rounds, logarithmic in the size of the components.
+
+        Returns:
+            labels (np.ndarray): The component of each node, components being
+                numbered from the largest to the smallest.
+            sizes (np.ndarray): The number of nodes of each component.
+        """
+        self._flush()
+        num_nodes = len(self.ids)
+        rows = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(self.indptr))
+        cols = self.indices
+        pointers = np.arange(num_nodes, dtype=np.int64)
+
+        while True:
+            roots_rows, roots_cols = pointers[rows], pointers[cols]
+            unmerged = roots_rows != roots_cols
+            if not np.any(unmerged):
+                break
+            roots_rows, roots_cols = roots_rows[unmerged], roots_cols[unmerged]
+            rows, cols = rows[unmerged], cols[unmerged]
+            np.minimum.at(pointers, roots_rows, roots_cols)
+            np.minimum.at(pointers, roots_cols, roots_rows)
+            while True:
+                jumped = pointers[pointers]
+                if np.array_equal(jumped, pointers):
+                    break
+                pointers = jumped
+
+        representatives, labels, sizes = np.unique(
+            pointers, return_inverse=True, return_counts=True
+        )
+        # renumber the components by decreasing size
+        by_size = np.argsort(-sizes, kind="stable")
+        rank = np.empty_like(by_size)
+        rank[by_size] = np.arange(len(by_size))
+        return rank[labels], sizes[by_size]
+
+    def largest_components(self, k: int = 10):
+        """
+        Returns the document ids of the nodes of the k largest weakly connected
+        components, from the largest.
+        """
+        labels, sizes = self.connected_components()
+        order = np.argsort(labels, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        return [
+            self.ids[order[bounds[c] : bounds[c + 1]]]
+            for c in range(min(k, len(sizes)))
+        ]
+
+    def _primary_parents(self):
+        num_nodes = len(self.ids)
+        rows = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(self.indptr))
+        # the closest parent of each child, ties going to the first node
+        order = np.lexsort((rows, self.weights, self.indices))
+        cols = self.indices[order]
+        first = np.ones(len(cols), dtype=bool)
+        first[1:] = cols[1:] != cols[:-1]
+        parent = np.full(num_nodes, -1, dtype=np.int64)
+        parent[cols[first]] = rows[order][first]
+        return parent
+
+    def _build_tree(self):
+        num_nodes = len(self.ids)
+        parent = self._primary_parents()
+
+        # children of each node in the primary-parent forest, in CSR format
+        has_parent = np.flatnonzero(parent >= 0)
+        tree_children = has_parent[np.argsort(parent[has_parent], kind="stable")]
+        tree_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(parent[has_parent], minlength=num_nodes), out=tree_indptr[1:]
+        )
+
+        # breadth-first levels from the roots, each level grouped by parent
+        levels = [np.flatnonzero(parent < 0)]
+        level_counts = []
+        reached = len(levels[0])
+        while len(levels[-1]):
+            positions, counts = _gather(tree_indptr, levels[-1])
+            levels.append(tree_children[positions])
+            level_counts.append(counts)
+            reached += len(levels[-1])
+        if reached < num_nodes:
+            raise ValueError(
+                f"{num_nodes - reached} nodes are on a cycle of primary parents, the "
+                "graph is not a DAG."
+            )
+
+        size = np.ones(num_nodes, dtype=np.int64)
+        for level in reversed(levels[1:]):
+            np.add.at(size, parent[level], size[level])
+
+        # preorder positions: a node comes right after its parent, after the
+        # subtrees of its previous siblings
+        tin = np.zeros(num_nodes, dtype=np.int64)
+        roots = levels[0]
+        tin[roots] = np.cumsum(size[roots]) - size[roots]
+        for level, counts in zip(levels[1:], level_counts):
+            if not len(level):
+                break
+            before = np.cumsum(size[level]) - size[level]
+            nonempty = counts > 0
+            group_starts = (np.cumsum(counts) - counts)[nonempty]
+            before -= np.repeat(before[group_starts], counts[nonempty])
+            tin[level] = tin[parent[level]] + 1 + before
+
+        order = np.empty(num_nodes, dtype=np.int64)
+        order[tin] = np.arange(num_nodes, dtype=np.int64)
+        self._tree = {"parent": parent, "tin": tin, "tout": tin + size, "order": order}
+
+    def _get_tree(self):
+        self._flush()
+        if self._tree is None:
+            self._build_tree()
+        return self._tree
+
+    def primary_parent(self, node_id):
+        """
+        Returns the document id of the primary parent of a node, or None for a
+        root.
+        """
+        parent = self._get_tree()["parent"][self.index(node_id)]
+        return None if parent < 0 else self.ids[parent]
+
+    def subtree(self, node_id):
+        """
+        Returns the document ids of a node and its descendants in the
+        primary-parent forest, in preorder.
+        """
+        tree = self._get_tree()
+        i = self.index(node_id)
+        return self.ids[tree["order"][tree["tin"][i] : tree["tout"][i]]]
+
+    def subtree_size(self, node_id):
+        tree = self._get_tree()
+        i = self.index(node_id)
+        return int(tree["tout"][i] - tree["tin"][i])
+
+    def is_descendant(self, node_ids, ancestor_id):
+        """
+        Checks whether nodes are in the subtree of an ancestor in the
+        primary-parent forest. A node is in its own subtree.
+
+        Args:
+            node_ids (int or array-like): The document ids to check.
+            ancestor_id (int): The document id of the root of the subtree.
+
+        Returns:
+            is_descendant (bool or np.ndarray): For each node.
+        """
+        tree = self._get_tree()
+        tin = tree["tin"][self.index(node_ids)]
+        ancestor = self.index(ancestor_id)
+        return (tree["tin"][ancestor] <= tin) & (tin < tree["tout"][ancestor])
+
+    def save(self, path: str):
+        """
+        Saves the arrays as .npy files in the path directory, along with the
+        subtree intervals once they are built. The intervals of a graph saved
+        earlier in the same directory are removed otherwise, so that they are not
+        loaded with this graph.
+        """
+        self._flush()
+        os.makedirs(path, exist_ok=True)
+        arrays = {name: getattr(self, name) for name in ARRAYS}
+        if self._tree is not None:
+            arrays.update(self._tree)
+        else:
+            for name in TREE_ARRAYS:
+                tree_path = os.path.join(path, f"{name}.npy")
+                if os.path.exists(tree_path):
+                    os.remove(tree_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """
+        Loads a graph saved with save(). With mmap, the arrays are memory-mapped
+        read-only instead of read, so loading takes no time and pages are read
+        on demand. Adding edges afterwards copies the arrays into memory.
+        """
+        mmap_mode = "r" if mmap else None
+        dag = cls()
+        for name in ARRAYS:
+            setattr(
+                dag,
+                name,
+                np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode),
+            )
+        tree_paths = [os.path.join(path, f"{name}.npy") for name in TREE_ARRAYS]
+        if all(os.path.exists(tree_path) for tree_path in tree_paths):
+            dag._tree = {
+                name: np.load(tree_path, mmap_mode=mmap_mode)
+                for name, tree_path in zip(TREE_ARRAYS, tree_paths)
+            }
+        return dag
@@ -0,0 +1,441 @@
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import utils.data as data_tools
+import utils.generic as tools
+import utils.synthetic as synthetic_tools
+from core import Enclaveid
+from langchain.llms.fake import FakeListLLM
+from utils.dispatch import Backend, Dispatcher
+
+SUPPORTED_TYPES = ["conversations", "searches"]
+DEFAULT_SAVE_PATH = os.path.join(os.getcwd(), "enclaveid_llm_output", "benchmark")
+
+# Number of searches or messages of the 1x dataset, over DEFAULT_START_DATE to
+# DEFAULT_END_DATE, so that 100x is 10M searches or 1M messages
+BASE_SIZES = {"searches": 100_000, "conversations": 10_000}
+DEFAULT_START_DATE = "2019-01-01"
+DEFAULT_END_DATE = "2023-12-31"
+
+# A stage whose time grows faster than size ** SUPERLINEAR_EXPONENT is reported
+SUPERLINEAR_EXPONENT = 1.2
+
+# Interval in seconds between two readings of the resident memory of a stage
+RSS_SAMPLING_INTERVAL = 0.01
+
+# Packing windows of the pack_chunks stage, in participants or days: a week and a
+# month of searches. A window of 1 packs each day or participant on its own.
+DEFAULT_PACKING_WINDOWS = [7, 30]
+
+TRAITS = list(tools.DEFAULT_SCORE)
+MOCK_CLASSIFICATIONS = [
+    '{"explanation": "mock", '
+    + ", ".join(f'"{trait}": "{level}"' for trait in TRAITS)
+    + "}"
+    for level in ["high", "low", "medium"]
+]
+MOCK_SCORES = [
+    '{"explanation": "mock", '
+    + ", ".join(f'"{trait}": {score}' for trait in TRAITS)
+    + "}"
+    for score in [0.25, 0.5, 0.75]
+]
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _get_rss():
+    """
+    Returns the resident memory of the process in bytes.
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # without procfs, fall back on the peak of the whole process, in bytes on
+        # macOS and in KB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    """
+    It measures the time and the peak resident memory of a stage of the pipeline,
+    reading the memory of the process from a background thread.
+    """
+
+    def __init__(self, name: str, report: dict):
+        self.name = name
+        self.report = report
+
+    def _sample(self):
+        while not self._done.wait(RSS_SAMPLING_INTERVAL):
+            self._peak = max(self._peak, _get_rss())
+
+    def __enter__(self):
+        self._done = threading.Event()
+        self._start_rss = self._peak = _get_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._start_time
+        self._done.set()
+        self._thread.join()
+        self._peak = max(self._peak, _get_rss())
+        self.report[self.name] = {
+            "seconds": round(seconds, 3),
+            "peak_rss_mb": round(self._peak / 2**20, 1),
+            "rss_growth_mb": round((self._peak - self._start_rss) / 2**20, 1),
+        }
+        logger.info(f"{self.name}: {self.report[self.name]}")
+
+
+def _mock_dispatchers():
+    # the mock LLMs answer instantly, in the format of the real answers, so the
+    # pipeline does all its non-LLM work: prompts, token counts, parsing
+    return {
+        "gpt-3.5": Dispatcher(
+            [Backend("mock-gpt-3.5", FakeListLLM(responses=MOCK_CLASSIFICATIONS))]
+        ),
+        "gpt-4": Dispatcher(
+            [Backend("mock-gpt-4", FakeListLLM(responses=MOCK_SCORES))]
+        ),
+    }
+
+
+def _run_stages(
+    data_path: str,
+    data_type: str,
+    period: str,
+    save_path: str,
+    mock_llm: bool,
+    packing_windows: list,
+):
+    """
+    Runs the stages of the pipeline on a dataset. It runs in a process of its own,
+    so that the memory of a dataset does not count in the next one.
+
+    Returns:
+        stages (dict): stage -> its time in seconds and peak RSS in MB.
+    """
+    # the pipeline logs every chunk, which would be timed as well
+    logging.getLogger().setLevel(logging.WARNING)
+    enclaveid_instance = Enclaveid(dispatchers=_mock_dispatchers())
+    max_tokens = enclaveid_instance.max_input_tokens
+    stages = {}
+
+    with _Stage("load_data", stages):
+        data, start_date, end_date = data_tools.load_data(data_path, data_type)
+    stages["load_data"]["items"] = len(data)
+
+    with _Stage("format_as_str", stages):
+        formatted = data_tools.format_as_str(data)
+
+    with _Stage("split", stages):
+        texts = tools.split(formatted, max_tokens=max_tokens)
+
+    with _Stage("generate_chunks", stages):
+        chunks = tools.generate_chunks(texts, max_tokens)
+    stages["generate_chunks"]["chunks"] = len(chunks)
+
+    localities = data_tools.get_localities(data)
+    for window in packing_windows:
+        stage = f"pack_chunks (window {window})"
+        with _Stage(stage, stages):
+            packed, fill_ratio = tools.pack_chunks(
+                formatted, max_tokens, localities=localities, window=window
+            )
+        stages[stage]["chunks"] = len(packed)
+        stages[stage]["fill_ratio"] = round(fill_ratio, 3)
+
+    with _Stage(f"split_into_periods ({period})", stages):
+        periods = data_tools.split_into_periods(data, start_date, end_date, period)
+    stages[f"split_into_periods ({period})"]["periods"] = len(periods)
+
+    if mock_llm:
+        os.makedirs(save_path, exist_ok=True)
+        with _Stage("score (mock LLM)", stages):
+            enclaveid_instance.score(
+                data, data_type, save_path=save_path, period_id="benchmark"
+            )
+    return stages
+
+
+def _get_exponents(report: dict, scales: list):
+    """
+    Returns, for each stage, how its time grows with the size of the data between
+    consecutive scales: 1 is linear, 2 is quadratic.
+    """
+    exponents = {}
+    for small, large in zip(scales, scales[1:]):
+        for stage, measures in report[f"{large}x"].items():
+            small_seconds = max(report[f"{small}x"][stage]["seconds"], 1e-3)
+            exponents.setdefault(stage, {})[f"{small}x-{large}x"] = round(
+                math.log(max(measures["seconds"], 1e-3) / small_seconds)
+                / math.log(large / small),
+                2,
+            )
+    return exponents
+
+
+def run(
+    data_type: str,
+    scales: list,
+    base_size: int = None,
+    start_date: str = DEFAULT_START_DATE,
+    end_date: str = DEFAULT_END_DATE,
+    period: str = "weekly",
+    data_dir: str = None,
+    save_path: str = DEFAULT_SAVE_PATH,
+    mock_llm: bool = True,
+    packing_windows: list = None,
+):
+    """
+    Generates a synthetic dataset at each scale, if not generated already, and
+    measures the time and peak RSS of each stage of the pipeline on it, with mock
+    LLMs instead of the OpenAI ones. The pack_chunks stage is measured for each
+    packing window, as with the --packing-window option of the cli.
+
+    Returns:
+        report (dict): scale -> stage -> measures, with the growth exponent of
+            each stage between consecutive scales under "exponents".
+    """
+    if data_type not in SUPPORTED_TYPES:
+        raise ValueError(
+            f"Data type {data_type} is not supported. We support {SUPPORTED_TYPES}."
+        )
+    scales = sorted(scales)
+    packing_windows = packing_windows or DEFAULT_PACKING_WINDOWS
+    base_size = base_size or BASE_SIZES[data_type]
+    data_dir = data_dir or os.path.join(save_path, "data")
+
+    report = {}
+    for scale in scales:
+        data_path = os.path.join(data_dir, data_type, f"{scale}x")
+        if not os.path.exists(data_path):
+            generate(data_type, base_size * scale, start_date, end_date, data_path)
+
+        logger.info(f"Running the pipeline on {base_size * scale} {data_type}.")
+        # a new process for each scale, so that peak memory is not carried over
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            report[f"{scale}x"] = executor.submit(
+                _run_stages,
+                data_path,
+                data_type,
+                period,
+                os.path.join(save_path, f"{scale}x"),
+                mock_llm,
+                packing_windows,
+            ).result()
+
+    exponents = _get_exponents(report, scales)
+    for stage, stage_exponents in exponents.items():
+        superlinear = any(e > SUPERLINEAR_EXPONENT for e in stage_exponents.values())
+        logger.info(
+            f"{stage}: growth exponents {stage_exponents}"
+            + (" <- superlinear" if superlinear else "")
+        )
+    report["exponents"] = exponents
+
+    tools.save_json(os.path.join(save_path, f"{data_type}_report.json"), report)
+    return report
+
+
+def generate(
+    data_type: str, size: int, start_date: str, end_date: str, save_path: str, seed=0
+):
+    start_time = time.perf_counter()
+    if data_type == "searches":
+        synthetic_tools.generate_searches(save_path, size, start_date, end_date, seed)
+    else:
+        synthetic_tools.generate_conversations(
+            save_path, size, start_date, end_date, seed=seed
+        )
+    logger.info(
+        f"Generated {size} {data_type} in {save_path} in "
+        f"{time.perf_counter() - start_time:.2f} seconds."
+    )
+
+
+@click.group()
+def main():
+    """Generates synthetic data and measures how the pipeline scales with it."""
+
+
+@main.command("generate")
+@click.option(
+    "-t", "--type", "data_type", required=True, help="'conversations' or 'searches'"
+)
+@click.option(
+    "-n",
+    "--size",
+    "size",
+    required=True,
+    type=int,
+    help="Number of searches or messages to generate.",
+)
+@click.option(
+    "-sd",
+    "--start-date",
+    "start_date",
+    required=False,
+    default=DEFAULT_START_DATE,
+    help=f"First date in the format YYYY-MM-DD. Default: {DEFAULT_START_DATE}",
+)
+@click.option(
+    "-ed",
+    "--end-date",
+    "end_date",
+    required=False,
+    default=DEFAULT_END_DATE,
+    help=f"Last date in the format YYYY-MM-DD. Default: {DEFAULT_END_DATE}",
+)
+@click.option(
+    "-o",
+    "--save-path",
+    "save_path",
+    required=True,
+    help="Directory where the CSV files will be written.",
+)
+@click.option(
+    "--seed", "seed", required=False, type=int, default=0, help="Random seed."
+)
+def generate_command(
+    data_type: str,
+    size: int,
+    start_date: str,
+    end_date: str,
+    save_path: str,
+    seed: int = 0,
+):
+    """Writes a synthetic tree of searches or conversations CSV files."""
+    if data_type.lower() not in SUPPORTED_TYPES:
+        raise ValueError(f"Data type '{data_type}' not supported.")
+    generate(data_type.lower(), size, start_date, end_date, save_path, seed)
+
+
+@main.command("run")
+@click.option(
+    "-t", "--type", "data_type", required=True, help="'conversations' or 'searches'"
+)
+@click.option(
+    "-s",
+    "--scale",
+    "scales",
+    required=False,
+    type=int,
+    multiple=True,
+    default=[1, 10, 100],
+    help="Size of a dataset, as a multiple of the base size. Default: 1, 10, 100",
+)
+@click.option(
+    "--base-size",
+    "base_size",
+    required=False,
+    type=int,
+    default=None,
+    help="Number of searches or messages at 1x. Default: 100000 searches or 10000 "
+    "messages.",
+)
+@click.option(
+    "-sd",
+    "--start-date",
+    "start_date",
+    required=False,
+    default=DEFAULT_START_DATE,
+    help=f"First date of the data in the format YYYY-MM-DD. Default: "
+    f"{DEFAULT_START_DATE}",
+)
+@click.option(
+    "-ed",
+    "--end-date",
+    "end_date",
+    required=False,
+    default=DEFAULT_END_DATE,
+    help=f"Last date of the data in the format YYYY-MM-DD. Default: {DEFAULT_END_DATE}",
+)
+@click.option(
+    "-p",
+    "--period",
+    "period",
+    required=False,
+    default="weekly",
+    type=click.Choice(["weekly", "monthly", "annually"]),
+    help="Period of the period split stage. Default: weekly",
+)
+@click.option(
+    "--data-dir",
+    "data_dir",
+    required=False,
+    default=None,
+    help="Directory of the synthetic datasets, reused across runs. Default: "
+    "[save_path]/data",
+)
+@click.option(
+    "--save-path",
+    "save_path",
+    required=False,
+    help=f"Path to save the report. Default: {DEFAULT_SAVE_PATH}",
+    default=DEFAULT_SAVE_PATH,
+)
+@click.option(
+    "-w",
+    "--packing-window",
+    "packing_windows",
+    required=False,
+    type=int,
+    multiple=True,
+    default=DEFAULT_PACKING_WINDOWS,
+    help="Packing window of the pack_chunks stage, as the --packing-window option "
+    "of the cli. Default: 7, 30",
+)
+@click.option(
+    "--mock-llm/--no-mock-llm",
+    "mock_llm",
+    default=True,
+    help="Whether to run the scoring stage with mock LLMs.",
+)
+def run_command(
+    data_type: str,
+    scales: tuple,
+    base_size: int = None,
+    start_date: str = DEFAULT_START_DATE,
+    end_date: str = DEFAULT_END_DATE,
+    period: str = "weekly",
+    data_dir: str = None,
+    save_path: str = DEFAULT_SAVE_PATH,
+    mock_llm: bool = True,
+    packing_windows: tuple = tuple(DEFAULT_PACKING_WINDOWS),
+):
+    """Measures the time and peak RSS of each stage at several data sizes."""
+    run(
+        data_type.lower(),
+        list(scales),
+        base_size=base_size,
+        start_date=start_date,
+        end_date=end_date,
+        period=period,
+        data_dir=data_dir,
+        save_path=save_path,
+        mock_llm=mock_llm,
+        packing_windows=list(packing_windows),
+    )
+
+
+if __name__ == "__main__":
+    main()
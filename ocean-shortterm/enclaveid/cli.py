@@ -2,13 +2,16 @@ import getpass
 import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import click
 import utils.data as data_tools
+import utils.dispatch as dispatch_tools
+import utils.parallel as parallel_tools
 from core import Enclaveid
 from dotenv import find_dotenv, load_dotenv
 from utils.generic import _calculate_scores_average as get_average_score
-from utils.generic import save_json
+from utils.generic import save_json, set_rate_limiter
 
 SUPPORTED_PERIODS = ["weekly", "monthly", "annually", "lifetime"]
 SUPPORTED_TYPES = ["conversations", "searches"]
@@ -18,6 +21,139 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _score_period(
+    enclaveid_instance: Enclaveid,
+    data: list,
+    data_type: str,
+    save_path: str,
+    period_id: str,
+    max_cost: float = None,
+    sample_rate: float = 1.0,
+    fused_model: str = None,
+):
+    if fused_model:
+        return enclaveid_instance.alternative_score(
+            data, data_type, save_path=save_path, period_id=period_id, model=fused_model
+        )
+    return enclaveid_instance.score(
+        data,
+        data_type,
+        save_path=save_path,
+        period_id=period_id,
+        max_cost=max_cost,
+        sample_rate=sample_rate,
+    )
+
+
+def _create_enclaveid(
+    ci_width: float = None, packing_window: int = None, backends_path: str = None
+):
+    return Enclaveid(
+        ci_width=ci_width,
+        packing_window=packing_window,
+        dispatchers=(
+            dispatch_tools.load_dispatchers(backends_path) if backends_path else None
+        ),
+    )
+
+
+# State of a worker process, set once when it starts
+_worker = {}
+
+
+def _init_worker(enclaveid_kwargs: dict, rate_limiter, cost_accumulator):
+    # each worker has its own Enclaveid, since the dispatchers hold threads and
+    # connections, while the rate limiter and the cost are shared by all of them
+    _worker["enclaveid"] = _create_enclaveid(**enclaveid_kwargs)
+    _worker["cost_accumulator"] = cost_accumulator
+    set_rate_limiter(rate_limiter)
+
+
+def _score_period_in_worker(
+    period_data: list, data_type: str, save_path: str, period_id: str, **kwargs
+):
+    cost_accumulator = _worker["cost_accumulator"]
+    # the budget of the period is its share of what is left when it starts
+    max_cost = None
+    if cost_accumulator.max_cost is not None:
+        max_cost = cost_accumulator.reserve(len(period_data))
+    score, cost = _score_period(
+        _worker["enclaveid"],
+        period_data,
+        data_type,
+        save_path,
+        period_id,
+        max_cost=max_cost,
+        **kwargs,
+    )
+    total_cost = cost_accumulator.add(cost, reserved=max_cost or 0.0)
+    if score is None:
+        return score, cost
+    # save period score as soon as the period is done
+    save_json(os.path.join(save_path, f"{period_id}.json"), score)
+    logger.info(
+        f"Obtained score {score} for the period {period_id} for {cost} USD. "
+        f"Total cost so far: {total_cost} USD."
+    )
+    return score, cost
+
+
+def _score_periods_in_parallel(
+    periods: list,
+    workers: int,
+    enclaveid_kwargs: dict,
+    data_type: str,
+    save_path: str,
+    max_cost: float = None,
+    sample_rate: float = 1.0,
+    fused_model: str = None,
+    rate_limiter: parallel_tools.RateLimiter = None,
+):
+    """
+    Scores the periods in a pool of worker processes.
+
+    The budget is shared through a cost accumulator: when a period starts, it
+    gets a share of the budget neither spent nor reserved by the running periods
+    in proportion to its number of data items, so the budget left by the periods
+    already done is carried over to the following ones.
+
+    Returns:
+        scores (list): The score of each period, in the order of the periods
+            whatever the order in which they finished, without the periods
+            skipped for lack of budget.
+        costs (list): The cost of each period, in the same order.
+    """
+    # periods share their boundary dates, so an item on a boundary counts in both
+    cost_accumulator = parallel_tools.CostAccumulator(
+        max_cost, sum(len(period_data) for _, period_data in periods)
+    )
+    results = [None] * len(periods)
+
+    logger.info(f"Scoring {len(periods)} periods with {workers} workers.")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(enclaveid_kwargs, rate_limiter, cost_accumulator),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _score_period_in_worker,
+                period_data,
+                data_type,
+                save_path,
+                period_id,
+                sample_rate=sample_rate,
+                fused_model=fused_model,
+            ): index
+            for index, (period_id, period_data) in enumerate(periods)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    results = [result for result in results if result[0] is not None]
+    return [score for score, _ in results], [cost for _, cost in results]
+
+
 def run(
     dir_path: str,
     period: str,
@@ -25,11 +161,32 @@ def run(
     start_date: str = "",
     end_date: str = "",
     save_path: str = DEFAULT_SAVE_PATH,
+    max_cost: float = None,
+    sample_rate: float = 1.0,
+    ci_width: float = None,
+    fused_model: str = None,
+    packing_window: int = None,
+    store_path: str = None,
+    backends_path: str = None,
+    workers: int = 1,
+    calls_per_minute: float = None,
 ):
     """
     scores OCEAN traits for the specified period. Then it average those
     scores to obtain a final one that represents all the data used.
 
+    When max_cost is set, the budget is shared among the periods in proportion
+    to their number of data items, and the budget left by a period is carried
+    over to the following ones.
+
+    With more than one worker, the periods are scored in parallel processes, each
+    with its own Enclaveid. The budget left by the periods done is then shared
+    among the periods that start after them, and the periods are averaged in date order whatever the order in which they finish.
+    calls_per_minute limits the LLM calls of all the workers together.
+
+    When fused_model is set, each chunk is classified and scored in a single call
+    to that model, see Enclaveid.alternative_score.
+
     Returns:
         final_score: The average score calculated from all scores generated
                over the periods.
@@ -45,8 +202,29 @@ def run(
             f"Data type {data_type} is not supported. We support {SUPPORTED_TYPES}."
         )
 
+    if fused_model and (
+        max_cost is not None or sample_rate < 1 or ci_width is not None
+    ):
+        raise ValueError(
+            "The fused pipeline does not support max_cost, sample_rate or ci_width."
+        )
+
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+
     saved_latest_score = None
-    enclaveid_instance = Enclaveid()
+    rate_limiter = (
+        parallel_tools.RateLimiter(calls_per_minute) if calls_per_minute else None
+    )
+    set_rate_limiter(rate_limiter)
+    enclaveid_kwargs = {
+        "ci_width": ci_width,
+        "packing_window": packing_window,
+        "backends_path": backends_path,
+    }
+    # the workers create their own instance
+    parallel = workers > 1 and period != "lifetime"
+    enclaveid_instance = None if parallel else _create_enclaveid(**enclaveid_kwargs)
 
     save_path = os.path.join(save_path, data_type, period)
 
@@ -59,7 +237,16 @@ def run(
     else:
         os.makedirs(save_path)
 
-    data, data_start_date, data_end_date = data_tools.load_data(dir_path, data_type)
+    # Only the data within the requested dates is loaded. For date-partitioned
+    # Parquet/Arrow datasets the filter is pushed down to the reader, and with a
+    # corpus store the date range is queried from its index.
+    data, data_start_date, data_end_date = data_tools.load_data(
+        dir_path,
+        data_type,
+        start_date=start_date,
+        end_date=end_date,
+        store_path=store_path,
+    )
 
     logger.info(
         f"The data in the data directory provided has as the oldest date: "
@@ -68,9 +255,9 @@ def run(
     )
 
     if start_date:
-        data_start_date = start_date
+        data_start_date = data_tools.str_to_date(start_date)
     if end_date:
-        data_end_date = end_date
+        data_end_date = data_tools.str_to_date(end_date)
 
     if data_start_date > data_end_date:
         raise ValueError("Start date must be before end data.")
@@ -88,69 +275,103 @@ def run(
             f"TO-{data_tools.date_to_str(data_end_date)}"
         )
 
-        final_score, final_cost = enclaveid_instance.score(
-            data, data_type, save_path=save_path, period_id=period_id
+        final_score, final_cost = _score_period(
+            enclaveid_instance,
+            data,
+            data_type,
+            save_path=save_path,
+            period_id=period_id,
+            max_cost=max_cost,
+            sample_rate=sample_rate,
+            fused_model=fused_model,
         )
         total_data_items = len(data)
-        logger.info(f"Obtained score: {final_score}")
+        if final_score is not None:
+            logger.info(f"Obtained score: {final_score}")
 
-        # save period score
-        int_save_path = os.path.join(save_path, f"{period_id}.json")
-        save_json(int_save_path, final_score)
+            # save period score
+            int_save_path = os.path.join(save_path, f"{period_id}.json")
+            save_json(int_save_path, final_score)
     else:
         logger.info(
             f"Using data from {data_start_date} to {data_end_date} on a {period} basis."
         )
-        scores = []
-        costs = []
-        while data_start_date < data_end_date:
-            current_period_end = data_tools.add_period(data_start_date, period)
-
-            # Use overall end date if we exceed it
-            if current_period_end > data_end_date:
-                current_period_end = data_end_date
-
-            start_date = data_tools.date_to_str(data_start_date)
-            end_date = data_tools.date_to_str(current_period_end)
-
-            # Extract data corresponding to this period
-            period_data = data_tools.extract_data_per_period(data, start_date, end_date)
-
-            # Process period data
+        periods = []
+        for start_date, end_date, period_data in data_tools.split_into_periods(
+            data, data_start_date, data_end_date, period
+        ):
             if period_data:
-                period_id = f"{start_date}-TO-{end_date}"
-
+                periods.append((f"{start_date}-TO-{end_date}", period_data))
+            else:
+                logger.info(
+                    f"No data to process for the period from {start_date} to {end_date}"
+                )
+            total_data_items += len(period_data)
+
+        if parallel:
+            scores, costs = _score_periods_in_parallel(
+                periods,
+                workers,
+                enclaveid_kwargs,
+                data_type,
+                save_path,
+                max_cost=max_cost,
+                sample_rate=sample_rate,
+                fused_model=fused_model,
+                rate_limiter=rate_limiter,
+            )
+        else:
+            scores = []
+            costs = []
+            # periods share their boundary dates, so an item on a boundary counts
+            # in both periods
+            remaining_items = sum(len(period_data) for _, period_data in periods)
+            for period_id, period_data in periods:
                 logger.info(
                     f"Processing {len(period_data)} data items corresponding "
-                    f"to the period from {start_date} to {end_date}"
+                    f"to the period {period_id}"
                 )
-                score, cost = enclaveid_instance.score(
-                    period_data, data_type, save_path=save_path, period_id=period_id
+                period_max_cost = None
+                if max_cost is not None:
+                    # the costs can go over the budget, which is checked against
+                    # estimated costs
+                    period_max_cost = max(
+                        0.0,
+                        (max_cost - sum(costs)) * len(period_data) / remaining_items,
+                    )
+                remaining_items -= len(period_data)
+
+                score, cost = _score_period(
+                    enclaveid_instance,
+                    period_data,
+                    data_type,
+                    save_path=save_path,
+                    period_id=period_id,
+                    max_cost=period_max_cost,
+                    sample_rate=sample_rate,
+                    fused_model=fused_model,
                 )
+                costs.append(cost)
+                if score is None:
+                    continue
                 logger.info(f"Obtained score: {score}")
                 scores.append(score)
-                costs.append(cost)
 
                 # save period score
                 int_save_path = os.path.join(save_path, f"{period_id}.json")
                 save_json(int_save_path, score)
 
-                # update starting date
-                data_start_date = current_period_end
-                total_data_items += len(period_data)
-
-            else:
-                logger.info(
-                    f"No data to process for the period from {start_date} to {end_date}"
-                )
-                data_start_date = current_period_end
-                total_data_items += len(period_data)
-                continue
-
         # average all scores
-        final_score = get_average_score(scores)
+        final_score = get_average_score(scores) if scores else None
         final_cost = sum(costs)
 
+    if final_score is None:
+        logger.info(
+            "No period was scored, for lack of data or of budget. The latest "
+            "saved score is left unchanged."
+        )
+        return saved_latest_score
+
     logger.info(f"Processed {total_data_items} items of data in total.")
     logger.info(
         f"Final score: {final_score} for the period from {data_start_date} "
@@ -184,7 +405,7 @@ def run(
     "--dir-path",
     "dir_path",
     required=True,
-    help="Directory path where the data CSV files are located.",
+    help="Directory path of the data CSV files or Parquet/Arrow dataset.",
 )
 @click.option(
     "-p",
@@ -217,6 +438,81 @@ def run(
     help=f"Path to save files generated by the program. Default: {DEFAULT_SAVE_PATH}",
     default=DEFAULT_SAVE_PATH,
 )
+@click.option(
+    "--max-cost",
+    "max_cost",
+    required=False,
+    type=float,
+    default=None,
+    help="Maximum cost in USD. Only a sample of the data that fits it is scored.",
+)
+@click.option(
+    "--sample-rate",
+    "sample_rate",
+    required=False,
+    type=float,
+    default=1.0,
+    help="Share of the data chunks to score, from 0 to 1. Default: 1.0",
+)
+@click.option(
+    "--ci-width",
+    "ci_width",
+    required=False,
+    type=float,
+    default=None,
+    help="Stop scoring once the 95% confidence interval of every trait is "
+    "narrower than this width, e.g. 0.1.",
+)
+@click.option(
+    "--fused-model",
+    "fused_model",
+    required=False,
+    type=click.Choice(["gpt-3.5", "gpt-4", "gpt-4-turbo"]),
+    default=None,
+    help="Classify and score each chunk in a single call to this model, instead "
+    "of classifying with gpt-3.5 and scoring with gpt-4.",
+)
+@click.option(
+    "--packing-window",
+    "packing_window",
+    required=False,
+    type=int,
+    default=None,
+    help="Pack the data items into as few chunks as possible, mixing only the "
+    "items of this many consecutive participants (or days, for searches).",
+)
+@click.option(
+    "--store",
+    "store_path",
+    required=False,
+    default=None,
+    help="Path of an SQLite corpus store. The CSV files are loaded into it once, "
+    "and later runs only parse the new or changed files.",
+)
+@click.option(
+    "--backends",
+    "backends_path",
+    required=False,
+    default=None,
+    help="Path of a JSON file listing the API keys, endpoints or replicas to "
+    "spread the LLM calls over, with hedged calls for the slow ones.",
+)
+@click.option(
+    "--workers",
+    "workers",
+    required=False,
+    type=int,
+    default=1,
+    help="Number of processes scoring the periods in parallel. Default: 1",
+)
+@click.option(
+    "--calls-per-minute",
+    "calls_per_minute",
+    required=False,
+    type=float,
+    default=None,
+    help="Maximum number of LLM calls per minute, shared by all the workers.",
+)
 def main(
     dir_path: str,
     period: str,
@@ -224,6 +520,15 @@ def main(
     start_date: str = "",
     end_date: str = "",
     save_path: str = DEFAULT_SAVE_PATH,
+    max_cost: float = None,
+    sample_rate: float = 1.0,
+    ci_width: float = None,
+    fused_model: str = None,
+    packing_window: int = None,
+    store_path: str = None,
+    backends_path: str = None,
+    workers: int = 1,
+    calls_per_minute: float = None,
 ):
     load_dotenv(find_dotenv(usecwd=True))
 
@@ -239,6 +544,15 @@ def main(
         start_date=start_date,
         end_date=end_date,
         save_path=save_path,
+        max_cost=max_cost,
+        sample_rate=sample_rate,
+        ci_width=ci_width,
+        fused_model=fused_model,
+        packing_window=packing_window,
+        store_path=store_path,
+        backends_path=backends_path,
+        workers=workers,
+        calls_per_minute=calls_per_minute,
     )
     print(final_score)
 
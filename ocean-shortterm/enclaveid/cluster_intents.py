@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import time
+
+import click
+import utils.intents as intents_tools
+from dotenv import find_dotenv, load_dotenv
+from openai import AsyncOpenAI
+from utils.interests import get_days
+
+DEFAULT_SAVE_PATH = os.path.join(os.getcwd(), "enclaveid_llm_output", "intents")
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run(
+    dir_path: str,
+    base_url: str = None,
+    model: str = intents_tools.DEFAULT_MODEL,
+    start_date: str = "",
+    end_date: str = "",
+    save_path: str = DEFAULT_SAVE_PATH,
+    max_concurrency: int = 16,
+    max_attempts: int = 3,
+    json_mode: bool = True,
+):
+    """
+    Clusters the search history of each day found in dir_path into reactive and
+    proactive intents, following summarization-benchmark/schema.json.
+
+    Returns:
+        stats (dict): The number of days done, read from the cache and retried,
+            the list of days that failed and the tokens used.
+    """
+    client = AsyncOpenAI(
+        base_url=base_url, api_key=os.environ.get("OPENAI_API_KEY", "EMPTY")
+    )
+    clusterer = intents_tools.IntentClusterer(
+        client,
+        model=model,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+        json_mode=json_mode,
+    )
+
+    days = get_days(dir_path, start_date, end_date)
+    logger.info(f"Found {len(days)} days of search history in {dir_path}")
+
+    start_time = time.perf_counter()
+    stats = asyncio.run(clusterer.run(days, save_path, start_date, end_date))
+    logger.info(
+        f"Clustered the intents of {stats['done']} days in "
+        f"{time.perf_counter() - start_time:.2f}s with {stats['input_tokens']} "
+        f"input and {stats['output_tokens']} output tokens. Reused "
+        f"{stats['cached']} days already done."
+    )
+    if stats["failed"]:
+        logger.info(
+            f"{len(stats['failed'])} days failed after {max_attempts} attempts: "
+            f"{stats['failed']}. Run the command again to retry them."
+        )
+    return stats
+
+
+@click.command()
+@click.option(
+    "-d",
+    "--dir-path",
+    "dir_path",
+    required=True,
+    help="Directory path where the search history CSV files are located.",
+)
+@click.option(
+    "--base-url",
+    "base_url",
+    required=False,
+    default=None,
+    help="Base URL of an OpenAI-compatible endpoint. Default: OpenAI's API",
+)
+@click.option(
+    "-m",
+    "--model",
+    "model",
+    required=False,
+    default=intents_tools.DEFAULT_MODEL,
+    help=f"Model name. Default: {intents_tools.DEFAULT_MODEL}",
+)
+@click.option(
+    "-sd",
+    "--start-date",
+    "start_date",
+    required=False,
+    help="Start date in the format YYYY-MM-DD.",
+)
+@click.option(
+    "-ed",
+    "--end-date",
+    "end_date",
+    required=False,
+    help="End date in the format YYYY-MM-DD.",
+)
+@click.option(
+    "--save_path",
+    "save_path",
+    required=False,
+    help=f"Path to save the intents. Default: {DEFAULT_SAVE_PATH}",
+    default=DEFAULT_SAVE_PATH,
+)
+@click.option(
+    "--max-concurrency",
+    "max_concurrency",
+    required=False,
+    type=int,
+    default=16,
+    help="Maximum number of requests in flight. Default: 16",
+)
+@click.option(
+    "--max-attempts",
+    "max_attempts",
+    required=False,
+    type=int,
+    default=3,
+    help="Maximum number of attempts for each day. Default: 3",
+)
+@click.option(
+    "--json-mode/--no-json-mode",
+    "json_mode",
+    default=True,
+    help="Whether to use the JSON output mode, if the endpoint supports it.",
+)
+def main(
+    dir_path: str,
+    base_url: str = None,
+    model: str = intents_tools.DEFAULT_MODEL,
+    start_date: str = "",
+    end_date: str = "",
+    save_path: str = DEFAULT_SAVE_PATH,
+    max_concurrency: int = 16,
+    max_attempts: int = 3,
+    json_mode: bool = True,
+):
+    load_dotenv(find_dotenv(usecwd=True))
+
+    run(
+        dir_path,
+        base_url=base_url,
+        model=model,
+        start_date=start_date,
+        end_date=end_date,
+        save_path=save_path,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+        json_mode=json_mode,
+    )
+
+
+if __name__ == "__main__":
+    main()
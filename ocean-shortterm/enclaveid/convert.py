@@ -0,0 +1,101 @@
+import logging
+import time
+
+import click
+import utils.data as data_tools
+import utils.messenger as messenger_tools
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@click.group()
+def main():
+    """Converts raw data exports into the formats expected by enclaveid/cli.py."""
+
+
+@main.command()
+@click.option(
+    "-i",
+    "--export-path",
+    "export_path",
+    required=True,
+    help="Root directory of the unzipped Instagram or Messenger export.",
+)
+@click.option(
+    "-o",
+    "--save-path",
+    "save_path",
+    required=True,
+    help="Directory where the conversations CSV files will be written.",
+)
+@click.option(
+    "-u",
+    "--username",
+    "username",
+    required=False,
+    default="",
+    help="Username of the export owner. Read from the export when not provided.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    "workers",
+    required=False,
+    type=int,
+    default=None,
+    help="Number of worker processes. Default: number of CPUs.",
+)
+def messenger(export_path: str, save_path: str, username: str = "", workers=None):
+    """Converts Instagram/Messenger inbox threads into conversations CSV files."""
+    start_time = time.perf_counter()
+    threads_count, messages_count = messenger_tools.convert_export(
+        export_path, save_path, username=username, workers=workers
+    )
+    logger.info(
+        f"Converted {threads_count} threads with {messages_count} messages into "
+        f"{save_path} in {time.perf_counter() - start_time:.2f} seconds."
+    )
+
+
+@main.command()
+@click.option(
+    "-d",
+    "--dir-path",
+    "dir_path",
+    required=True,
+    help="Directory path where the data CSV files are located.",
+)
+@click.option(
+    "-o",
+    "--save-path",
+    "save_path",
+    required=True,
+    help="Directory where the partitioned dataset will be written.",
+)
+@click.option(
+    "-t", "--type", "data_type", required=True, help="'conversations' or 'searches'"
+)
+@click.option(
+    "-f",
+    "--format",
+    "file_format",
+    required=False,
+    default="parquet",
+    type=click.Choice(["parquet", "ipc"]),
+    help="File format of the dataset: 'parquet' or 'ipc' (Arrow). Default: parquet",
+)
+def dataset(dir_path: str, save_path: str, data_type: str, file_format="parquet"):
+    """Converts a tree of CSV files into a dataset partitioned by date."""
+    start_time = time.perf_counter()
+    rows_count = data_tools.convert_to_dataset(
+        dir_path, save_path, data_type.lower(), file_format=file_format
+    )
+    logger.info(
+        f"Wrote {rows_count} rows of {data_type} into {save_path} in "
+        f"{time.perf_counter() - start_time:.2f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import os
 
 import utils.data as data_tools
 import utils.generic as tools
+import utils.sampling as sampling_tools
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,10 +14,41 @@ class Enclaveid:
     This class implements the pipeline to score Conversation or HistorySearch data.
     """
 
-    def __init__(self, max_input_tokens=3076):
+    def __init__(
+        self,
+        max_input_tokens=3076,
+        ci_width=None,
+        packing_window=None,
+        dispatchers=None,
+    ):
+        """
+        Args:
+            max_input_tokens (int): Maximum number of tokens of each chunk of data.
+            ci_width (float): Optional early stopping of the scoring. When set, the
+                              scoring stops once the 95% confidence interval of
+                              every trait score is narrower than ci_width.
+            packing_window (int): Optional bin packing of the data items into
+                                  chunks. When set, the items of up to
+                                  packing_window consecutive participants (or
+                                  days, for searches) can share a chunk.
+            dispatchers (dict): Optional dispatchers of the "gpt-3.5" and "gpt-4"
+                                calls, which spread them over several backends and
+                                hedge the slow ones, see utils.dispatch.
+        """
         self.max_input_tokens = max_input_tokens
+        self.ci_width = ci_width
+        self.packing_window = packing_window
+        self.dispatchers = dispatchers or {}
 
-    def score(self, data: list, mode: str, save_path: str, period_id: str):
+    def score(
+        self,
+        data: list,
+        mode: str,
+        save_path: str,
+        period_id: str,
+        max_cost: float = None,
+        sample_rate: float = 1.0,
+    ):
         """scores the provided data based on OCEAN personality traits.
 
         Args:
@@ -26,10 +58,16 @@ class Enclaveid:
                         "conversations" or "searches".
             save_path (str): path to save intermediate files.
             period_id (str): period identifier to name intermediate files.
+            max_cost (float): Optional maximum cost in USD. When set, only a
+                              stratified sample of chunks that fits the budget
+                              is scored.
+            sample_rate (float): Share of chunks to score, sampled by time period
+                                 and data source. Default: 1.0 (all chunks).
 
         Returns:
             score (dict): A dictionary containing the OCEAN traits scores for
-                          the provided data.
+                          the provided data, or None if the budget does not
+                          allow scoring any chunk.
             cost (float): The cost in USD of generating the scores dict using
                           OpenAI's models.
         """
@@ -49,9 +87,141 @@ class Enclaveid:
         # Transform the data into strings while retaining only the relevant fields.
         # For example, for Conversations, we keep only the sender's name and the
         # message whereas in search history, we only keep the search title.
+        items = data
         data = data_tools.format_as_str(data)
+
+        sampling = max_cost is not None or sample_rate < 1
+        if sampling:
+            chunks, sampling_info = self._sample_chunks(
+                items, data, mode, max_cost, sample_rate
+            )
+            if not chunks:
+                logger.info(
+                    f"Skipping the period {period_id}: a budget of {max_cost} USD "
+                    "does not allow scoring any chunk."
+                )
+                return None, 0.0
+        else:
+            chunks = self._generate_chunks(data, data_tools.get_localities(items))
+
+        # When the cost is bounded, the classification may only spend what is not
+        # reserved for scoring the high-classified chunks it is expected to find.
+        classification_budget = None
+        if max_cost is not None:
+            classification_budget = tools.Budget(
+                max_cost - sampling_info["estimated_scoring_cost"]
+            )
+
+        # Classify each chunk of data by its OCEAN trait signals
+        logger.info(f"Classify {len(chunks)} total chunks of data")
+        classified_chunks, in_tokens, out_tokens, cached_tokens = tools.classify(
+            chunks,
+            mode=mode,
+            budget=classification_budget,
+            dispatcher=self.dispatchers.get("gpt-3.5"),
+        )
+        used_tokens["gpt-3.5"] = [in_tokens, out_tokens, cached_tokens]
+        tools.save_json(
+            os.path.join(save_path, f"{period_id}_classification_results.json"),
+            classified_chunks,
+        )
+
+        # Remove low classified signals
+        logger.info("Remove low classified chunks")
+        chunks = tools.remove_low_classified_chunks(classified_chunks)
+        logger.info(
+            f"Only {len(chunks)} out of {len(classified_chunks)} "
+            "chunks have at least one trait classified as high."
+        )
+
+        # Score the high-classified chunks
+        logger.info(f"Scoring a total of {len(chunks)} chunks.")
+        if sampling:
+            scoring_budget = None
+            if max_cost is not None:
+                scoring_budget = tools.Budget(max_cost - classification_budget.cost)
+            scores, in_tokens, out_tokens, cached_tokens, early_stopping = (
+                tools.score_chunks(
+                    chunks,
+                    budget=scoring_budget,
+                    ci_width=self.ci_width,
+                    dispatcher=self.dispatchers.get("gpt-4"),
+                )
+            )
+            score = (
+                tools._calculate_scores_average(scores)
+                if scores
+                else dict(tools.DEFAULT_SCORE)
+            )
+        else:
+            score, in_tokens, out_tokens, cached_tokens, early_stopping = (
+                tools.score_items(
+                    chunks,
+                    ci_width=self.ci_width,
+                    dispatcher=self.dispatchers.get("gpt-4"),
+                )
+            )
+        used_tokens["gpt-4"] = [in_tokens, out_tokens, cached_tokens]
+
+        # Calculating the cost, with the input tokens read from the prompt cache
+        # billed at their discounted price
+        cost = tools.calculate_cost(used_tokens)
+        logger.info(
+            f"{tools.get_cached_rate(used_tokens):.1%} of the input tokens were "
+            f"read from the prompt cache. Tokens used: {used_tokens}"
+        )
+        for model, dispatcher in self.dispatchers.items():
+            logger.info(f"Dispatch of the {model} calls: {dispatcher.stats}")
+
+        # The report of the chunks left out by sampling and early stopping
+        if sampling:
+            # The sampling error is estimated over the chunks actually classified,
+            # which can be fewer than sampled if the budget ran out.
+            sampling_info.update(
+                {
+                    "classified_chunks": len(classified_chunks),
+                    "scored_chunks": len(scores),
+                    "cost": cost,
+                    "sampling_error": sampling_tools.sampling_error(
+                        scores,
+                        len(classified_chunks) / sampling_info["population_chunks"],
+                    ),
+                }
+            )
+        elif early_stopping:
+            sampling_info = {"classified_chunks": len(classified_chunks), "cost": cost}
+        if early_stopping:
+            sampling_info["early_stopping"] = early_stopping
+        if sampling or early_stopping:
+            logger.info(f"Sampling summary: {sampling_info}")
+            tools.save_json(
+                os.path.join(save_path, f"{period_id}_sampling.json"), sampling_info
+            )
+
+        return score, cost
+
+    def _generate_chunks(self, data: list, localities: list = None):
+        """
+        Splits the formatted data items that are too large and concatenates them
+        into chunks of up to max_input_tokens tokens, packing the items of nearby
+        localities together when packing_window is set.
+        """
         data_size = len(data)
 
+        if self.packing_window:
+            chunks, fill_ratio = tools.pack_chunks(
+                data,
+                self.max_input_tokens,
+                localities=localities,
+                window=self.packing_window,
+            )
+            logger.info(
+                f"We packed {data_size} data items into {len(chunks)} chunks of "
+                f"data with a maximum size of {self.max_input_tokens} tokens, "
+                f"{fill_ratio:.1%} full on average."
+            )
+            return chunks
+
         # Each data item comprises a set of searches or messages. Some of these
         # sets can be quite large, so we split them into smaller subsets.
         logger.info("Split large data items into smaller items")
@@ -72,34 +242,130 @@ class Enclaveid:
             f"We compressed {data_size} data items into {len(chunks)} chunks "
             f"of data with a maximum size of {self.max_input_tokens} tokens."
         )
+        return chunks
 
-        # Classify each chunk of data by its OCEAN trait signals
-        logger.info(f"Classify {len(chunks)} total chunks of data")
-        classified_chunks, in_tokens, out_tokens = tools.classify(chunks, mode=mode)
-        used_tokens["gpt-3.5"] = [in_tokens, out_tokens]
+    def _sample_chunks(
+        self,
+        items: list,
+        data: list,
+        mode: str,
+        max_cost: float = None,
+        sample_rate: float = 1.0,
+    ):
+        """
+        Draws a sample of chunks stratified by month and data source, as large as
+        the sample rate and the estimated cost of the chunks allow.
+
+        Returns:
+            chunks (list): The sampled chunks.
+            sampling_info (dict): The population and sample sizes and the
+                estimated costs.
+        """
+        # Chunks never mix data items of different strata. A stratum is a locality
+        # of its own when packing.
+        strata = {}
+        for stratum, texts in sampling_tools.group_by_stratum(items, data).items():
+            if self.packing_window:
+                strata[stratum], _ = tools.pack_chunks(texts, self.max_input_tokens)
+                continue
+            texts = tools.split(texts, max_tokens=self.max_input_tokens)
+            strata[stratum] = tools.generate_chunks(texts, self.max_input_tokens)
+        population = sum(len(chunks) for chunks in strata.values())
+
+        all_chunks = [chunk for chunks in strata.values() for chunk in chunks]
+        classification_cost, scoring_cost = tools.estimate_cost(all_chunks, mode)
+        chunk_cost = (classification_cost + scoring_cost) / population
+
+        sample_size = max(1, round(population * sample_rate))
+        if max_cost is not None:
+            # the budget can be used up, or overspent since it is checked against
+            # estimated costs
+            sample_size = max(0, min(sample_size, int(max_cost // chunk_cost)))
+
+        chunks = sampling_tools.sample(strata, sample_size)
+        sampling_info = {
+            "population_chunks": population,
+            "strata": len(strata),
+            "sample_size": len(chunks),
+            "sample_rate": sample_rate,
+            "max_cost": max_cost,
+            "estimated_cost": round(chunk_cost * len(chunks), 4),
+            "estimated_scoring_cost": round(
+                scoring_cost / population * len(chunks), 4
+            ),
+        }
+        logger.info(
+            f"Sampled {len(chunks)} out of {population} chunks across "
+            f"{len(strata)} strata. Estimated cost: "
+            f"{sampling_info['estimated_cost']} USD (full run: "
+            f"{round(classification_cost + scoring_cost, 4)} USD)."
+        )
+        return chunks, sampling_info
+
+    def alternative_score(
+        self,
+        data: list,
+        mode: str,
+        save_path: str,
+        period_id: str,
+        model: str = "gpt-4-turbo",
+    ):
+        """scores the provided data based on OCEAN personality traits, with a single
+        classify-and-score LLM call per chunk of data instead of a classification
+        call followed by a scoring call for the high-classified chunks.
+
+        Args:
+            data (list): A list of objects, either of Conversation type or
+                         HistorySearch type.
+            mode (str): Specifies the type of data being scored, either
+                        "conversations" or "searches".
+            save_path (str): path to save intermediate files.
+            period_id (str): period identifier to name intermediate files.
+            model (str): The model to use, one of "gpt-3.5", "gpt-4" or
+                         "gpt-4-turbo". Default: "gpt-4-turbo".
+
+        Returns:
+            score (dict): A dictionary containing the OCEAN traits scores for
+                          the provided data.
+            cost (float): The cost in USD of generating the scores dict using
+                          OpenAI's models.
+        """
+        if not data:
+            raise TypeError(f"Not data provided to score. period_id {period_id}")
+
+        if mode == "conversations":
+            data = sorted(data, key=lambda conv: ",".join(sorted(conv.participants)))
+
+        chunks = self._generate_chunks(
+            data_tools.format_as_str(data), data_tools.get_localities(data)
+        )
+
+        logger.info(f"Classify and score {len(chunks)} total chunks with {model}")
+        classified_chunks, in_tokens, out_tokens, cached_tokens = (
+            tools.classify_and_score(chunks, mode=mode, model=model)
+        )
         tools.save_json(
-            os.path.join(save_path, f"{period_id}_classification_results.json"),
+            os.path.join(save_path, f"{period_id}_fused_results.json"),
             classified_chunks,
         )
 
-        # Remove low classified signals
-        logger.info("Remove low classified chunks")
+        # As in the two-pass pipeline, only the chunks with at least one trait
+        # classified as high make the score
         chunks = tools.remove_low_classified_chunks(classified_chunks)
         logger.info(
             f"Only {len(chunks)} out of {len(classified_chunks)} "
             "chunks have at least one trait classified as high."
         )
+        score = (
+            tools._calculate_scores_average([chunk["scores"] for chunk in chunks])
+            if chunks
+            else dict(tools.DEFAULT_SCORE)
+        )
 
-        # Score the high-classified chunks
-        logger.info(f"Scoring a total of {len(chunks)} chunks.")
-        score, in_tokens, out_tokens = tools.score_items(chunks)
-        used_tokens["gpt-4"] = [in_tokens, out_tokens]
-
-        # Calculating the cost
+        used_tokens = {model: [in_tokens, out_tokens, cached_tokens]}
         cost = tools.calculate_cost(used_tokens)
-
+        logger.info(
+            f"{tools.get_cached_rate(used_tokens):.1%} of the input tokens were "
+            f"read from the prompt cache. Tokens used: {used_tokens}"
+        )
         return score, cost
-
-    def alternative_score(self, data: list, mode: str):
-        # TODO: implement alternative version for testing
-        pass
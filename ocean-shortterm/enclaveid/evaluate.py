@@ -0,0 +1,136 @@
+import functools
+import getpass
+import logging
+import os
+
+import click
+import utils.evaluation as eval_tools
+from dotenv import find_dotenv, load_dotenv
+from utils.generic import save_json
+
+SUPPORTED_TYPES = ["conversations", "searches"]
+DEFAULT_SAVE_PATH = os.path.join(os.getcwd(), "enclaveid_llm_output", "evaluation")
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run(
+    data_type: str,
+    fused_model: str = "gpt-4-turbo",
+    save_path: str = DEFAULT_SAVE_PATH,
+    compare_templates: bool = False,
+):
+    """
+    Runs the two-pass pipeline (gpt-3.5 classification then gpt-4 scoring) and the
+    fused classify-and-score pipeline on the labeled evaluation items, and
+    compares their accuracy, cost and latency.
+
+    With compare_templates, the two-pass pipeline is run instead with the legacy
+    prompts, which had the text in the middle, and with the current ones, which
+    have it last for prompt caching. The rendered prompts are compared line by
+    line, and the answers of the two runs item by item.
+
+    Returns:
+        comparison (dict): pipeline -> evaluation summary.
+    """
+    if data_type not in SUPPORTED_TYPES:
+        raise ValueError(
+            f"Data type {data_type} is not supported. We support {SUPPORTED_TYPES}."
+        )
+
+    items = eval_tools.load_eval_items(data_type)
+    logger.info(f"Evaluating the pipelines on {len(items)} {data_type} items.")
+
+    os.makedirs(save_path, exist_ok=True)
+    if compare_templates:
+        prompts = eval_tools.compare_prompts(items, data_type)
+        save_json(os.path.join(save_path, f"{data_type}_prompts.json"), prompts)
+        logger.info(f"Legacy and current prompts: {prompts}")
+        pipelines = {
+            "two-pass-legacy": functools.partial(
+                eval_tools.predict_two_pass, data_type=data_type, legacy=True
+            ),
+            "two-pass": functools.partial(
+                eval_tools.predict_two_pass, data_type=data_type
+            ),
+        }
+    else:
+        pipelines = {
+            "two-pass": functools.partial(
+                eval_tools.predict_two_pass, data_type=data_type
+            ),
+            f"fused-{fused_model}": functools.partial(
+                eval_tools.predict_fused, data_type=data_type, model=fused_model
+            ),
+        }
+
+    comparison = {}
+    results = {}
+    for name, predict in pipelines.items():
+        evaluation = eval_tools.evaluate(predict, items)
+        save_json(os.path.join(save_path, f"{data_type}_{name}.json"), evaluation)
+        comparison[name] = evaluation["summary"]
+        results[name] = evaluation["items"]
+        logger.info(f"{name}: {evaluation['summary']}")
+
+    if compare_templates:
+        comparison["legacy-vs-current"] = eval_tools.compare_results(
+            results["two-pass-legacy"], results["two-pass"]
+        )
+        logger.info(f"legacy-vs-current: {comparison['legacy-vs-current']}")
+
+    save_json(os.path.join(save_path, f"{data_type}_comparison.json"), comparison)
+    return comparison
+
+
+@click.command()
+@click.option(
+    "-t", "--type", "data_type", required=True, help="'conversations' or 'searches'"
+)
+@click.option(
+    "--fused-model",
+    "fused_model",
+    required=False,
+    type=click.Choice(["gpt-3.5", "gpt-4", "gpt-4-turbo"]),
+    default="gpt-4-turbo",
+    help="Model of the fused classify-and-score pipeline. Default: gpt-4-turbo",
+)
+@click.option(
+    "--save_path",
+    "save_path",
+    required=False,
+    help=f"Path to save the evaluation results. Default: {DEFAULT_SAVE_PATH}",
+    default=DEFAULT_SAVE_PATH,
+)
+@click.option(
+    "--compare-templates",
+    "compare_templates",
+    is_flag=True,
+    default=False,
+    help="Compare the two-pass pipeline with the legacy and the current prompts.",
+)
+def main(
+    data_type: str,
+    fused_model: str = "gpt-4-turbo",
+    save_path: str = DEFAULT_SAVE_PATH,
+    compare_templates: bool = False,
+):
+    load_dotenv(find_dotenv(usecwd=True))
+
+    if not os.environ.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = getpass.getpass(
+            prompt="Enter your OpenAI API key: "
+        )
+
+    comparison = run(
+        data_type.lower(),
+        fused_model=fused_model,
+        save_path=save_path,
+        compare_templates=compare_templates,
+    )
+    print(comparison)
+
+
+if __name__ == "__main__":
+    main()
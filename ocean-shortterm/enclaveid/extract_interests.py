@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import time
+
+import click
+import httpx
+import utils.interests as interests_tools
+from dotenv import find_dotenv, load_dotenv
+from openai import AsyncOpenAI
+
+DEFAULT_SAVE_PATH = os.path.join(os.getcwd(), "enclaveid_llm_output", "interests")
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run(
+    dir_path: str,
+    base_url: str = None,
+    model: str = interests_tools.DEFAULT_MODEL,
+    start_date: str = "",
+    end_date: str = "",
+    save_path: str = DEFAULT_SAVE_PATH,
+    max_concurrency: int = 256,
+    max_attempts: int = 3,
+):
+    """
+    Extracts the interests of each day of search history found in dir_path and
+    saves them as one JSON file per day.
+
+    Returns:
+        stats (dict): The number of days done, skipped and retried, and the list
+            of days that failed.
+    """
+    client = AsyncOpenAI(
+        base_url=base_url,
+        api_key=os.environ.get("OPENAI_API_KEY", "EMPTY"),
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+            timeout=60 * 10,
+        ),
+    )
+    extractor = interests_tools.InterestsExtractor(
+        client,
+        model=model,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+    )
+
+    days = interests_tools.get_days(dir_path, start_date, end_date)
+    logger.info(f"Found {len(days)} days of search history in {dir_path}")
+
+    start_time = time.perf_counter()
+    stats = asyncio.run(extractor.run(days, save_path))
+    elapsed = time.perf_counter() - start_time
+
+    logger.info(
+        f"Extracted interests of {stats['done']} days in {elapsed:.2f}s "
+        f"({stats['done'] / elapsed if elapsed else 0:.2f} days/s). "
+        f"Skipped {stats['skipped']} days already done."
+    )
+    if stats["failed"]:
+        logger.info(
+            f"{len(stats['failed'])} days failed after {max_attempts} attempts: "
+            f"{stats['failed']}. Run the command again to retry them."
+        )
+    return stats
+
+
+@click.command()
+@click.option(
+    "-d",
+    "--dir-path",
+    "dir_path",
+    required=True,
+    help="Directory path where the search history CSV files are located.",
+)
+@click.option(
+    "--base-url",
+    "base_url",
+    required=False,
+    default=None,
+    help="Base URL of an OpenAI-compatible endpoint, e.g. a vLLM server.",
+)
+@click.option(
+    "-m",
+    "--model",
+    "model",
+    required=False,
+    default=interests_tools.DEFAULT_MODEL,
+    help=f"Model name. Default: {interests_tools.DEFAULT_MODEL}",
+)
+@click.option(
+    "-sd",
+    "--start-date",
+    "start_date",
+    required=False,
+    help="Start date in the format YYYY-MM-DD.",
+)
+@click.option(
+    "-ed",
+    "--end-date",
+    "end_date",
+    required=False,
+    help="End date in the format YYYY-MM-DD.",
+)
+@click.option(
+    "--save_path",
+    "save_path",
+    required=False,
+    help=f"Path to save the interests of each day. Default: {DEFAULT_SAVE_PATH}",
+    default=DEFAULT_SAVE_PATH,
+)
+@click.option(
+    "--max-concurrency",
+    "max_concurrency",
+    required=False,
+    type=int,
+    default=256,
+    help="Maximum number of requests in flight. Default: 256",
+)
+@click.option(
+    "--max-attempts",
+    "max_attempts",
+    required=False,
+    type=int,
+    default=3,
+    help="Maximum number of attempts for each day. Default: 3",
+)
+def main(
+    dir_path: str,
+    base_url: str = None,
+    model: str = interests_tools.DEFAULT_MODEL,
+    start_date: str = "",
+    end_date: str = "",
+    save_path: str = DEFAULT_SAVE_PATH,
+    max_concurrency: int = 256,
+    max_attempts: int = 3,
+):
+    load_dotenv(find_dotenv(usecwd=True))
+
+    run(
+        dir_path,
+        base_url=base_url,
+        model=model,
+        start_date=start_date,
+        end_date=end_date,
+        save_path=save_path,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+    )
+
+
+if __name__ == "__main__":
+    main()
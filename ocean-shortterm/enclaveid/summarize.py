@@ -0,0 +1,175 @@
+import logging
+import os
+import time
+
+import click
+import utils.summary_tree as summary_tools
+from dotenv import find_dotenv, load_dotenv
+from openai import OpenAI
+from utils.catalog import get_catalog
+
+DEFAULT_SAVE_PATH = os.path.join(os.getcwd(), "enclaveid_llm_output", "summaries")
+DEFAULT_MODEL = "mistral-small"
+MISTRAL_BASE_URL = "https://api.mistral.ai/v1"
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _get_days(dir_path: str, start_date: str = "", end_date: str = ""):
+    entries = get_catalog(dir_path).select(
+        kind="raw",
+        start_date=start_date or None,
+        end_date=end_date or None,
+        extension=".csv",
+    )
+    days = []
+    for path, entry in entries:
+        with open(path, "r") as file:
+            days.append((entry["date"], file.read()))
+    return days
+
+
+def run(
+    dir_path: str,
+    base_url: str = MISTRAL_BASE_URL,
+    model: str = DEFAULT_MODEL,
+    start_date: str = "",
+    end_date: str = "",
+    save_path: str = DEFAULT_SAVE_PATH,
+    workers: int = 8,
+    fanout: int = 12,
+):
+    """
+    Summarizes the search history found in dir_path into day, week, month and
+    lifetime summaries, reusing the cached summaries of the unchanged nodes.
+
+    Returns:
+        tree (dict): The summaries of each level and the nodes statistics.
+    """
+    client = OpenAI(
+        base_url=base_url,
+        api_key=os.environ.get("MISTRAL_API_KEY") or os.environ.get("OPENAI_API_KEY"),
+        timeout=120,
+    )
+
+    def complete(prompt: str):
+        answer = client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}]
+        )
+        return answer.choices[0].message.content
+
+    days = _get_days(dir_path, start_date, end_date)
+    logger.info(f"Found {len(days)} days of search history in {dir_path}")
+
+    tree_builder = summary_tools.SummaryTree(
+        complete,
+        model,
+        cache_path=os.path.join(save_path, "cache"),
+        workers=workers,
+        fanout=fanout,
+    )
+    start_time = time.perf_counter()
+    tree = tree_builder.build(days)
+    summary_tools.save_tree(tree, save_path)
+
+    stats = tree["stats"]
+    logger.info(
+        f"Computed {stats['computed']} summaries and reused {stats['cached']} "
+        f"cached ones in {time.perf_counter() - start_time:.2f}s."
+    )
+    if stats["failed"]:
+        logger.info(
+            f"{len(stats['failed'])} summaries failed: {stats['failed']}. "
+            f"Blocked parents: {stats['blocked']}. Run the command again to retry."
+        )
+    return tree
+
+
+@click.command()
+@click.option(
+    "-d",
+    "--dir-path",
+    "dir_path",
+    required=True,
+    help="Directory path where the search history CSV files are located.",
+)
+@click.option(
+    "--base-url",
+    "base_url",
+    required=False,
+    default=MISTRAL_BASE_URL,
+    help=f"Base URL of an OpenAI-compatible endpoint. Default: {MISTRAL_BASE_URL}",
+)
+@click.option(
+    "-m",
+    "--model",
+    "model",
+    required=False,
+    default=DEFAULT_MODEL,
+    help=f"Model name. Default: {DEFAULT_MODEL}",
+)
+@click.option(
+    "-sd",
+    "--start-date",
+    "start_date",
+    required=False,
+    help="Start date in the format YYYY-MM-DD.",
+)
+@click.option(
+    "-ed",
+    "--end-date",
+    "end_date",
+    required=False,
+    help="End date in the format YYYY-MM-DD.",
+)
+@click.option(
+    "--save_path",
+    "save_path",
+    required=False,
+    help=f"Path to save the summaries and their cache. Default: {DEFAULT_SAVE_PATH}",
+    default=DEFAULT_SAVE_PATH,
+)
+@click.option(
+    "-w",
+    "--workers",
+    "workers",
+    required=False,
+    type=int,
+    default=8,
+    help="Number of LLM calls made in parallel. Default: 8",
+)
+@click.option(
+    "--fanout",
+    "fanout",
+    required=False,
+    type=int,
+    default=12,
+    help="Number of months reduced together above the month level. Default: 12",
+)
+def main(
+    dir_path: str,
+    base_url: str = MISTRAL_BASE_URL,
+    model: str = DEFAULT_MODEL,
+    start_date: str = "",
+    end_date: str = "",
+    save_path: str = DEFAULT_SAVE_PATH,
+    workers: int = 8,
+    fanout: int = 12,
+):
+    load_dotenv(find_dotenv(usecwd=True))
+
+    run(
+        dir_path,
+        base_url=base_url,
+        model=model,
+        start_date=start_date,
+        end_date=end_date,
+        save_path=save_path,
+        workers=workers,
+        fanout=fanout,
+    )
+
+
+if __name__ == "__main__":
+    main()
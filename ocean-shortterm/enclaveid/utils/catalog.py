@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+
+from sortedcontainers import SortedList
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The manifest lives in its own hidden directory, which is never scanned, so
+# saving it does not change the modification time of the catalogued directories.
+MANIFEST_DIR = ".enclaveid"
+MANIFEST_NAME = "catalog.json"
+MANIFEST_VERSION = 1
+
+PROVIDERS = ["google", "facebook", "instagram", "messenger", "whatsapp"]
+KINDS = ["raw", "summary", "interests", "embeddings"]
+
+# Data files are named after their date, optionally followed by a summary level
+# as in the long-term OCEAN files (YYYY-MM-DD.0.txt).
+DATE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.")
+
+
+def _get_provider(path_parts: list):
+    for part in path_parts[:-1]:
+        if part.lower() in PROVIDERS:
+            return part.lower()
+    return "unknown"
+
+
+def _get_kind(path_parts: list, summary_level: str):
+    directories = [part.lower() for part in path_parts[:-1]]
+    if path_parts[-1].endswith(".npy") or any("embedding" in d for d in directories):
+        return "embeddings"
+    if any("interests" in d for d in directories):
+        return "interests"
+    if summary_level is not None or any("summary" in d for d in directories):
+        return "summary"
+    return "raw"
+
+
+def _hash_file(file_path: str):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _join(rel_dir: str, name: str):
+    return name if rel_dir == "." else f"{rel_dir}/{name}"
+
+
+class Catalog:
+    """
+    It keeps a persistent manifest of the data files found under a root
+    directory, with their provider, kind (raw, summary, interests or embeddings),
+    date, size and modification time.
+
+    The manifest is kept current using modification times: only the directories
+    whose modification time changed (files added, removed or renamed) are listed
+    again, and only their entries are updated in the index. The content of a file
+    is only read when its hash is asked for. Files are indexed by date to answer
+    date range queries in O(log n).
+    """
+
+    def __init__(self, root: str, manifest_path: str = None):
+        self.root = os.path.abspath(root)
+        self.manifest_path = manifest_path or os.path.join(
+            self.root, MANIFEST_DIR, MANIFEST_NAME
+        )
+        self.dirs = {}
+        self._load_manifest()
+        self._build_index()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, "r") as json_file:
+                manifest = json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            logger.info(f"Ignoring unreadable catalog manifest {self.manifest_path}")
+            return
+        if manifest.get("version") == MANIFEST_VERSION:
+            self.dirs = manifest["dirs"]
+
+    def save(self):
+        """
+        Writes the manifest atomically next to the data.
+        """
+        manifest = {"version": MANIFEST_VERSION, "dirs": self.dirs}
+        temp_path = f"{self.manifest_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(temp_path, "w") as json_file:
+                json.dump(manifest, json_file)
+            os.replace(temp_path, self.manifest_path)
+        except OSError as error:
+            logger.info(f"Could not save the catalog manifest: {error}")
+
+    def _describe(self, rel_path: str, stat):
+        path_parts = rel_path.split("/")
+        match = DATE_PATTERN.match(path_parts[-1])
+        date, summary_level = match.groups() if match else (None, None)
+        return {
+            "provider": _get_provider(path_parts),
+            "kind": _get_kind(path_parts, summary_level),
+            "level": int(summary_level) if summary_level is not None else None,
+            "date": date,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        }
+
+    def _is_unchanged(self, entry: dict, stat):
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+
+    def _scan_dir(self, rel_dir: str, dir_mtime: int):
+        """
+        Lists a directory, reusing the entries of the files that did not change.
+        """
+        previous_files = self.dirs.get(rel_dir, {}).get("files", {})
+        files = {}
+        subdirs = []
+
+        with os.scandir(os.path.join(self.root, rel_dir)) as entries:
+            for entry in entries:
+                if entry.name == MANIFEST_DIR:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(_join(rel_dir, entry.name))
+                    continue
+                stat = entry.stat()
+                previous = previous_files.get(entry.name)
+                if previous and self._is_unchanged(previous, stat):
+                    files[entry.name] = previous
+                else:
+                    files[entry.name] = self._describe(_join(rel_dir, entry.name), stat)
+
+        self.dirs[rel_dir] = {"mtime": dir_mtime, "subdirs": subdirs, "files": files}
+
+    def refresh(self, full: bool = False):
+        """
+        Brings the manifest up to date with the files on disk and saves it.
+
+        Args:
+            full (bool): List every directory and check the size and modification
+                         time of every file, instead of only looking into the
+                         directories that were modified. Use it when files may
+                         have been rewritten in place.
+
+        Returns:
+            self (Catalog): The refreshed catalog.
+        """
+        pending = ["."]
+        seen_dirs = set()
+        changed = False
+
+        while pending:
+            rel_dir = pending.pop()
+            try:
+                dir_mtime = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen_dirs.add(rel_dir)
+
+            node = self.dirs.get(rel_dir)
+            if full or node is None or node["mtime"] != dir_mtime:
+                self._index_dir(rel_dir, remove=True)
+                self._scan_dir(rel_dir, dir_mtime)
+                self._index_dir(rel_dir)
+                changed = True
+            pending.extend(self.dirs[rel_dir]["subdirs"])
+
+        for rel_dir in set(self.dirs) - seen_dirs:
+            self._index_dir(rel_dir, remove=True)
+            del self.dirs[rel_dir]
+            changed = True
+
+        if changed:
+            self.save()
+        return self
+
+    def _build_index(self):
+        self._index = defaultdict(SortedList)
+        self._undated = defaultdict(SortedList)
+        # path -> (absolute path, entry), as returned by select()
+        self._entries = {}
+        for rel_dir in self.dirs:
+            self._index_dir(rel_dir)
+
+    def _index_dir(self, rel_dir: str, remove: bool = False):
+        """
+        Adds the files of a directory to the date index, or removes them.
+        """
+        node = self.dirs.get(rel_dir)
+        if node is None:
+            return
+        for name, entry in node["files"].items():
+            key = (entry["provider"], entry["kind"])
+            rel_path = _join(rel_dir, name)
+            if entry["date"]:
+                index, value = self._index[key], (entry["date"], rel_path)
+            else:
+                index, value = self._undated[key], rel_path
+            if remove:
+                index.discard(value)
+                self._entries.pop(rel_path, None)
+            else:
+                index.add(value)
+                self._entries[rel_path] = (os.path.join(self.root, rel_path), entry)
+
+    def entry(self, rel_path: str):
+        rel_dir, name = os.path.split(rel_path)
+        return self.dirs[rel_dir or "."]["files"][name]
+
+    def file_hash(self, rel_path: str):
+        """
+        Returns the content hash of a file, computing it on the first call only.
+        The hash is kept in the entry until the file changes, and saved with the
+        manifest on the next save().
+        """
+        entry = self.entry(rel_path)
+        if "hash" not in entry:
+            entry["hash"] = _hash_file(os.path.join(self.root, rel_path))
+        return entry["hash"]
+
+    def select(
+        self,
+        kind: str = None,
+        start_date: str = None,
+        end_date: str = None,
+        provider: str = None,
+        extension: str = None,
+        include_undated: bool = False,
+    ):
+        """
+        Returns the catalog entries matching the given filters, sorted by date.
+
+        Args:
+            kind (str): "raw", "summary", "interests" or "embeddings".
+            start_date (str): Optional first date, in the format YYYY-MM-DD.
+            end_date (str): Optional last date, in the format YYYY-MM-DD.
+            provider (str): Optional data provider, e.g. "google".
+            extension (str): Optional file extension, e.g. ".csv".
+            include_undated (bool): Include the files whose name is not a date.
+                                    They are not filtered by date.
+
+        Returns:
+            entries (list): A list of (path, entry) tuples.
+        """
+        minimum = (start_date,) if start_date else None
+        # ("YYYY-MM-DD\0",) sorts right after every path of that date
+        maximum = (f"{end_date}\0",) if end_date else None
+
+        # (date, path) of the files, with an empty date for the undated ones
+        items = []
+        for key in sorted(set(self._index) | set(self._undated)):
+            entry_provider, entry_kind = key
+            if kind and entry_kind != kind:
+                continue
+            if provider and entry_provider != provider:
+                continue
+            if key in self._index:
+                items.extend(self._index[key].irange(minimum, maximum))
+            if include_undated and key in self._undated:
+                items.extend(("", rel_path) for rel_path in self._undated[key])
+
+        if extension:
+            items = [item for item in items if item[1].endswith(extension)]
+
+        # the items of each key are already sorted, which makes this sort cheap
+        items.sort()
+        return [self._entries[rel_path] for _, rel_path in items]
+
+    def get_filenames(
+        self, kind="raw", start_date=None, end_date=None, provider=None, **filters
+    ):
+        """
+        Drop-in replacement for the get_filenames helper of the notebooks.
+
+        Returns:
+            filenames (list): The paths of the files matching the filters.
+        """
+        entries = self.select(
+            kind=kind,
+            start_date=start_date,
+            end_date=end_date,
+            provider=provider,
+            **filters,
+        )
+        return [path for path, _ in entries]
+
+
+# Catalogs already loaded, by root directory, kept for the life of the process
+_catalogs = {}
+
+
+def get_catalog(root: str, full: bool = False):
+    """
+    Loads the catalog of a root directory on the first call only, and brings it
+    up to date.
+    """
+    root = os.path.abspath(root)
+    if root not in _catalogs:
+        _catalogs[root] = Catalog(root)
+    return _catalogs[root].refresh(full=full)
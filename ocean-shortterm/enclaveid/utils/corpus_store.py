@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import sqlite3
+
+import tiktoken
+
+from .data_handler import Conversation, SearchHistory
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_TYPES = ["conversations", "searches"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    data_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    participants TEXT NOT NULL,
+    records TEXT NOT NULL,
+    formatted TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    UNIQUE (data_type, source, date, participants)
+);
+CREATE INDEX IF NOT EXISTS items_by_date ON items (data_type, date);
+CREATE INDEX IF NOT EXISTS items_by_participants
+    ON items (data_type, participants, date);
+CREATE TABLE IF NOT EXISTS item_participants (
+    item_id INTEGER NOT NULL REFERENCES items (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    PRIMARY KEY (item_id, name)
+);
+CREATE INDEX IF NOT EXISTS item_participants_by_name ON item_participants (name);
+CREATE TABLE IF NOT EXISTS sources (
+    data_type TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    root TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (data_type, path)
+);
+"""
+
+
+def _check_type(data_type):
+    if data_type not in SUPPORTED_TYPES:
+        raise ValueError(f"Data type '{data_type}' not supported.")
+
+
+def _date_to_str(date):
+    return date.strftime("%Y-%m-%d")
+
+
+class SQLiteDataHandler:
+    """
+    It stores conversations and search history in an SQLite database, with the
+    same interface as DataHandler. The data is kept on disk across runs, so it is
+    only parsed again when its source file changes, and date ranges are queried
+    through an index without holding the whole corpus in memory.
+
+    Each item is stored with its formatted string and its number of tokens, so
+    that other tools can read them without formatting the items again.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database, created if needed.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        # WAL lets readers query the store while a run is writing to it
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+        # the stores created before the root of the sources was recorded
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(sources)")
+        ]
+        if "root" not in columns:
+            self.connection.execute(
+                "ALTER TABLE sources ADD COLUMN root TEXT NOT NULL DEFAULT ''"
+            )
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def close(self):
+        self.connection.close()
+
+    def _to_row(self, item, data_type, source, formatted):
+        if data_type == "conversations":
+            participants = sorted(item.participants)
+            records = {"participants": item.participants, "messages": item.messages}
+        else:
+            participants = []
+            records = {"searches": item.searches}
+        return (
+            data_type,
+            source,
+            _date_to_str(item.date),
+            json.dumps(participants),
+            json.dumps(records),
+            formatted,
+            len(self.encoding.encode(formatted)),
+        )
+
+    def _insert_rows(self, rows):
+        for row in rows:
+            item_id = self.connection.execute(
+                "INSERT INTO items (data_type, source, date, participants, records, "
+                "formatted, tokens) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (data_type, source, date, participants) DO UPDATE SET "
+                "records = excluded.records, formatted = excluded.formatted, "
+                "tokens = excluded.tokens RETURNING id",
+                row,
+            ).fetchone()[0]
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO item_participants (item_id, name) VALUES (?, ?)",
+                [(item_id, name) for name in json.loads(row[3])],
+            )
+
+    def upsert_items(self, items, data_type, source, formatted):
+        """
+        Inserts or updates a batch of items in a single transaction.
+
+        Args:
+            items (list): Conversation or SearchHistory items.
+            data_type (str): "conversations" or "searches".
+            source (str): The file the items were loaded from.
+            formatted (list): The formatted string of each item.
+        """
+        _check_type(data_type)
+        with self.connection:
+            self._insert_rows(
+                [
+                    self._to_row(item, data_type, source, text)
+                    for item, text in zip(items, formatted)
+                ]
+            )
+
+    def add_data_item(self, item, data_type, source="", formatted=""):
+        self.upsert_items([item], data_type, source, [formatted])
+
+    def ingest_files(self, file_paths, data_type, load_file, format_items, root=None):
+        """
+        Loads the new and changed files into the store. A changed file replaces
+        all the items previously loaded from it.
+
+        With a root, each file is recorded with the root it was listed from, and
+        the files previously ingested from that root that are no longer listed
+        are removed, so that the store mirrors the files of each root while other
+        roots can share it.
+
+        Args:
+            file_paths (list): The CSV files to ingest.
+            data_type (str): "conversations" or "searches".
+            load_file (callable): Takes a file path and the data type and returns
+                its items.
+            format_items (callable): Takes a list of items and returns their
+                formatted strings.
+            root (str): Optional directory the files were listed from.
+
+        Returns:
+            ingested (int): The number of files parsed, the others were unchanged.
+        """
+        _check_type(data_type)
+        root = root or ""
+        known = {
+            path: (mtime, size, source_root)
+            for path, mtime, size, source_root in self.connection.execute(
+                "SELECT path, mtime, size, root FROM sources WHERE data_type = ?",
+                (data_type,),
+            )
+        }
+
+        ingested = 0
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            mtime, size, source_root = known.get(file_path, (None, None, None))
+            if (mtime, size) == (stat.st_mtime, stat.st_size):
+                if source_root != root:
+                    with self.connection:
+                        self.connection.execute(
+                            "UPDATE sources SET root = ? WHERE data_type = ? "
+                            "AND path = ?",
+                            (root, data_type, file_path),
+                        )
+                continue
+
+            items = load_file(file_path, data_type)
+            rows = [
+                self._to_row(item, data_type, file_path, text)
+                for item, text in zip(items, format_items(items))
+            ]
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM items WHERE data_type = ? AND source = ?",
+                    (data_type, file_path),
+                )
+                self._insert_rows(rows)
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO sources (data_type, path, mtime, size, "
+                    "root) VALUES (?, ?, ?, ?, ?)",
+                    (data_type, file_path, stat.st_mtime, stat.st_size, root),
+                )
+            ingested += 1
+
+        removed = []
+        if root:
+            listed = set(file_paths)
+            removed = sorted(
+                path
+                for path, (_, _, source_root) in known.items()
+                if source_root == root and path not in listed
+            )
+        with self.connection:
+            for file_path in removed:
+                self.connection.execute(
+                    "DELETE FROM items WHERE data_type = ? AND source = ?",
+                    (data_type, file_path),
+                )
+                self.connection.execute(
+                    "DELETE FROM sources WHERE data_type = ? AND path = ?",
+                    (data_type, file_path),
+                )
+
+        logger.info(
+            f"Ingested {ingested} new or changed files into {self.db_path}, "
+            f"{len(file_paths) - ingested} were unchanged and {len(removed)} were "
+            "removed."
+        )
+        return ingested
+
+    def _to_item(self, data_type, date, records):
+        records = json.loads(records)
+        if data_type == "conversations":
+            return Conversation(date, records["messages"], records["participants"])
+        return SearchHistory(date, records["searches"])
+
+    def _query(self, columns, data_type, start_date="", end_date=""):
+        _check_type(data_type)
+        query = f"SELECT {columns} FROM items WHERE data_type = ?"
+        parameters = [data_type]
+        if start_date:
+            query += " AND date >= ?"
+            parameters.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            parameters.append(end_date)
+        return self.connection.execute(f"{query} ORDER BY date, id", parameters)
+
+    def iter_data(self, data_type, start_date="", end_date=""):
+        """
+        Iterates over the items of a date range in date order, one at a time.
+        """
+        for date, records in self._query(
+            "date, records", data_type, start_date, end_date
+        ):
+            yield self._to_item(data_type, date, records)
+
+    def get_data_by_type(self, data_type):
+        return list(self.iter_data(data_type))
+
+    def get_data(self, data_type, start_date="", end_date=""):
+        data = list(self.iter_data(data_type, start_date, end_date))
+        if not data:
+            return [], None, None
+        return data, data[0].date, data[-1].date
+
+    def get_data_by_date_range(self, start_date, end_date, data_type):
+        return list(self.iter_data(data_type, start_date, end_date))
+
+    def get_formatted(self, data_type, start_date="", end_date=""):
+        """
+        Returns the formatted strings and the numbers of tokens of the items of a
+        date range, without building the items.
+
+        Returns:
+            rows (list): A list of (date, formatted string, tokens) tuples.
+        """
+        return self._query(
+            "date, formatted, tokens", data_type, start_date, end_date
+        ).fetchall()
+
+    def get_data_by_participant(self, name, data_type="conversations"):
+        _check_type(data_type)
+        rows = self.connection.execute(
+            "SELECT items.date, items.records FROM items JOIN item_participants "
+            "ON item_participants.item_id = items.id WHERE item_participants.name = ? "
+            "AND items.data_type = ? ORDER BY items.date, items.id",
+            (name, data_type),
+        )
+        return [self._to_item(data_type, date, records) for date, records in rows]
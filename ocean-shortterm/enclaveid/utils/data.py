@@ -5,6 +5,9 @@ from datetime import datetime
 
 from dateutil.relativedelta import relativedelta
 
+from . import catalog as catalog_tools
+from . import dataset as dataset_tools
+from .corpus_store import SQLiteDataHandler
 from .data_handler import Conversation, DataHandler, SearchHistory
 
 INMEMORY_DATA_MANAGER = DataHandler()
@@ -21,13 +24,20 @@ def add_period(date, period):
         return date
 
 
-def _get_files_path(dir_path):
-    csv_paths = []
-    for root, _, files in os.walk(dir_path):
-        for file in files:
-            if file.endswith(".csv"):
-                csv_paths.append(os.path.join(root, file))
-    return csv_paths
+def _get_files_path(dir_path, start_date="", end_date=""):
+    """
+    Lists the CSV files under a directory using its cached data catalog. Files
+    named after a date (YYYY-MM-DD.csv) are filtered by the date range, the
+    others are always returned.
+    """
+    catalog = catalog_tools.get_catalog(dir_path)
+    entries = catalog.select(
+        start_date=start_date or None,
+        end_date=end_date or None,
+        extension=".csv",
+        include_undated=True,
+    )
+    return [path for path, _ in entries]
 
 
 def _load_file(file_path, file_type):
@@ -58,28 +68,111 @@ def _load_file(file_path, file_type):
         return []
 
 
-def _load_content(dir_path, data_type):
+def _is_date_in_range(date, start_date="", end_date=""):
+    # dates in the format YYYY-MM-DD can be compared as strings
+    return (not start_date or start_date <= date) and (not end_date or date <= end_date)
+
+
+def _load_csv_content(dir_path, data_type, start_date="", end_date=""):
+    items = []
+    # search files are named after their date, so the catalog can skip the files
+    # out of the date range without parsing them
+    if data_type == "searches":
+        files_path = _get_files_path(dir_path, start_date, end_date)
+    else:
+        files_path = _get_files_path(dir_path)
+
+    for file_path in files_path:
+        items.extend(_load_file(file_path, data_type))
+
+    if start_date or end_date:
+        items = [
+            item
+            for item in items
+            if _is_date_in_range(date_to_str(item.date), start_date, end_date)
+        ]
+    return items
+
+
+def _load_content(dir_path, data_type, start_date="", end_date=""):
     """
     It loads Conversation-type and HistorySearch-type items into the data manager.
+    The data can be either a tree of CSV files or a Parquet/Arrow dataset
+    partitioned by date, in which case only the partitions within the date range
+    are read.
     """
-    files_path = _get_files_path(dir_path)
+    if dataset_tools.get_format(dir_path):
+        items = dataset_tools.load_items(dir_path, data_type, start_date, end_date)
+    else:
+        items = _load_csv_content(dir_path, data_type, start_date, end_date)
+
+    for item in items:
+        INMEMORY_DATA_MANAGER.add_data_item(item, data_type)
+
+
+def _load_store(dir_path, data_type, store_path):
+    """
+    It loads the new and changed CSV files into the SQLite corpus store, so that
+    the files already loaded by a previous run are not parsed again.
+    """
+    store = SQLiteDataHandler(store_path)
+    store.ingest_files(
+        _get_files_path(dir_path),
+        data_type,
+        _load_file,
+        format_as_str,
+        root=os.path.abspath(dir_path),
+    )
+    return store
 
-    for file_path in files_path:
-        file_data = _load_file(file_path, data_type)
-        for item in file_data:
-            INMEMORY_DATA_MANAGER.add_data_item(item, data_type)
 
+def load_data(dir_path, data_type, start_date="", end_date="", store_path=None):
+    """
+    Loads the data items of a directory within the date range.
 
-def load_data(dir_path, data_type):
-    _load_content(dir_path, data_type)
+    When store_path is set, the CSV files are loaded through the SQLite corpus
+    store at that path instead of the in-memory data manager, and only the date
+    range is read back from it.
+
+    Returns:
+        data (list): The Conversation-type or HistorySearch-type items.
+        oldest_date (datetime): The date of the oldest item.
+        newest_date (datetime): The date of the newest item.
+    """
+    if store_path and not dataset_tools.get_format(dir_path):
+        store = _load_store(dir_path, data_type, store_path)
+        try:
+            return store.get_data(data_type, start_date, end_date)
+        finally:
+            store.close()
+
+    _load_content(dir_path, data_type, start_date, end_date)
     return INMEMORY_DATA_MANAGER.get_data(data_type)
 
 
 def load_data_per_date_range(dir_path, start_date, end_date, data_type):
-    _load_content(dir_path, data_type)
+    _load_content(dir_path, data_type, start_date, end_date)
     return INMEMORY_DATA_MANAGER.get_data_by_date_range(start_date, end_date, data_type)
 
 
+def convert_to_dataset(dir_path, save_path, data_type, file_format="parquet"):
+    """
+    Converts a tree of CSV files into a Parquet or Arrow IPC dataset partitioned
+    by date.
+
+    Returns:
+        rows_count (int): The number of rows written.
+    """
+    return dataset_tools.write_dataset(
+        _get_files_path(dir_path),
+        _load_file,
+        dir_path,
+        save_path,
+        data_type,
+        file_format,
+    )
+
+
 def extract_data_per_period(data, start_date, end_date):
     start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
     end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
@@ -92,10 +185,43 @@ def extract_data_per_period(data, start_date, end_date):
         return [hist for hist in data if start_datetime <= hist.date <= end_datetime]
 
 
+def split_into_periods(data, start_date, end_date, period):
+    """
+    Splits the data items into consecutive periods from start_date to end_date.
+    Consecutive periods share their boundary date.
+
+    Args:
+        data (list): The Conversation-type or HistorySearch-type items.
+        start_date (datetime): Start of the first period.
+        end_date (datetime): End of the last period.
+        period (str): "weekly", "monthly" or "annually".
+
+    Returns:
+        periods (list): A list of (start date, end date, items) tuples, with the
+            dates in the format YYYY-MM-DD, including the periods without items.
+    """
+    periods = []
+    while start_date < end_date:
+        # Use overall end date if we exceed it
+        period_end_date = min(add_period(start_date, period), end_date)
+        period_start = date_to_str(start_date)
+        period_end = date_to_str(period_end_date)
+
+        # Extract data corresponding to this period
+        period_data = extract_data_per_period(data, period_start, period_end)
+        periods.append((period_start, period_end, period_data))
+        start_date = period_end_date
+    return periods
+
+
 def date_to_str(date: datetime):
     return datetime.strftime(date, "%Y-%m-%d")
 
 
+def str_to_date(date: str):
+    return datetime.strptime(date, "%Y-%m-%d")
+
+
 def format_as_str(raw_data):
     str_data = []
     if raw_data:
@@ -119,3 +245,14 @@ def format_as_str(raw_data):
                     searches_str += f"{search['title']} at {search['hour']} \n"
                 str_data.append(searches_str)
     return str_data
+
+
+def get_localities(raw_data):
+    """
+    Returns the locality of each data item, i.e. its participants for
+    conversations and its day for search histories, used to pack the items that
+    share a context in the same chunks.
+    """
+    if raw_data and isinstance(raw_data[0], Conversation):
+        return [",".join(sorted(item.participants)) for item in raw_data]
+    return [date_to_str(item.date) for item in raw_data]
@@ -82,4 +82,4 @@ class DataHandler:
         start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
         end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
         data = self.get_data_by_type(data_type)
-        return [item for item in data if start_datetime <= data.date <= end_datetime]
+        return [item for item in data if start_datetime <= item.date <= end_datetime]
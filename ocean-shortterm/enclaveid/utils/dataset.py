@@ -0,0 +1,179 @@
+import os
+from collections import defaultdict
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from .data_handler import Conversation, SearchHistory
+
+SUPPORTED_FORMATS = {".parquet": "parquet", ".arrow": "ipc", ".feather": "ipc"}
+
+# Columns stored in the files of each data type. The date is not stored in the
+# files: it is the partition key and it is encoded in the directory names
+# (date=YYYY-MM-DD), which lets us skip whole partitions when filtering by date.
+COLUMNS = {
+    "conversations": ["thread", "participants", "sender_name", "content", "time"],
+    "searches": ["hour", "title"],
+}
+
+SCHEMAS = {
+    "conversations": pa.schema(
+        [
+            ("thread", pa.string()),
+            ("participants", pa.list_(pa.string())),
+            ("sender_name", pa.string()),
+            ("content", pa.string()),
+            ("time", pa.string()),
+            ("date", pa.string()),
+        ]
+    ),
+    "searches": pa.schema(
+        [("hour", pa.string()), ("title", pa.string()), ("date", pa.string())]
+    ),
+}
+
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def get_format(dir_path):
+    """
+    Detects whether a directory holds a partitioned Parquet or Arrow IPC dataset.
+
+    Returns:
+        file_format (str): "parquet" or "ipc", or None if the directory contains
+            CSV files or no dataset files at all.
+    """
+    for _, _, files in os.walk(dir_path):
+        for file in files:
+            extension = os.path.splitext(file)[1]
+            if extension == ".csv":
+                return None
+            if extension in SUPPORTED_FORMATS:
+                return SUPPORTED_FORMATS[extension]
+    return None
+
+
+def _date_filter(start_date="", end_date=""):
+    date = ds.field("date")
+    expression = None
+    if start_date:
+        expression = date >= start_date
+    if end_date:
+        expression = (
+            date <= end_date if expression is None else expression & (date <= end_date)
+        )
+    return expression
+
+
+def read_table(dir_path, data_type, start_date="", end_date=""):
+    """
+    Reads a date-partitioned dataset, only opening the partitions that fall in
+    the date range and only reading the columns used by the data type.
+
+    Args:
+        dir_path (str): Root directory of the dataset.
+        data_type (str): "conversations" or "searches".
+        start_date (str): Optional first date to read, in the format YYYY-MM-DD.
+        end_date (str): Optional last date to read, in the format YYYY-MM-DD.
+
+    Returns:
+        table (pyarrow.Table): The rows of the selected partitions.
+    """
+    dataset = ds.dataset(
+        dir_path, format=get_format(dir_path) or "parquet", partitioning=PARTITIONING
+    )
+    return dataset.to_table(
+        columns=COLUMNS[data_type] + ["date"],
+        filter=_date_filter(start_date, end_date),
+    )
+
+
+def load_items(dir_path, data_type, start_date="", end_date=""):
+    """
+    Loads Conversation-type or SearchHistory-type items from a date-partitioned
+    dataset.
+
+    Returns:
+        items (list): The data items within the date range.
+    """
+    columns = read_table(dir_path, data_type, start_date, end_date).to_pydict()
+
+    if data_type == "conversations":
+        participants = {}
+        messages = defaultdict(list)
+        for thread, thread_participants, sender_name, content, time, date in zip(
+            *(columns[name] for name in COLUMNS[data_type] + ["date"])
+        ):
+            participants[thread] = thread_participants
+            messages[(thread, date)].append(
+                {"sender_name": sender_name, "content": content, "time": time}
+            )
+        return [
+            Conversation(date, day_messages, participants[thread])
+            for (thread, date), day_messages in messages.items()
+        ]
+
+    if data_type == "searches":
+        searches = defaultdict(list)
+        for hour, title, date in zip(
+            columns["hour"], columns["title"], columns["date"]
+        ):
+            searches[date].append({"hour": hour, "title": title})
+        return [
+            SearchHistory(date, day_searches) for date, day_searches in searches.items()
+        ]
+
+    return []
+
+
+def _to_table(file_data, data_type, thread):
+    rows = defaultdict(list)
+    for item in file_data:
+        date = item.date.strftime("%Y-%m-%d")
+        if data_type == "conversations":
+            for message in item.messages:
+                rows["thread"].append(thread)
+                rows["participants"].append(item.participants)
+                rows["sender_name"].append(message["sender_name"])
+                rows["content"].append(message["content"])
+                rows["time"].append(message["time"])
+                rows["date"].append(date)
+        else:
+            for search in item.searches:
+                rows["hour"].append(search["hour"])
+                rows["title"].append(search["title"])
+                rows["date"].append(date)
+    if not rows:
+        return SCHEMAS[data_type].empty_table()
+    return pa.Table.from_pydict(dict(rows), schema=SCHEMAS[data_type])
+
+
+def write_dataset(csv_paths, load_file, dir_path, save_path, data_type, file_format):
+    """
+    Converts a tree of CSV files into a dataset partitioned by date.
+
+    Args:
+        csv_paths (list): The CSV files to convert.
+        load_file (callable): Parses a CSV file into data items.
+        dir_path (str): Root directory of the CSV files.
+        save_path (str): Directory where the dataset will be written.
+        data_type (str): "conversations" or "searches".
+        file_format (str): "parquet" or "ipc".
+
+    Returns:
+        rows_count (int): The number of rows written.
+    """
+    tables = []
+    for csv_path in csv_paths:
+        thread = os.path.relpath(csv_path, dir_path)
+        tables.append(_to_table(load_file(csv_path, data_type), data_type, thread))
+
+    table = pa.concat_tables(tables) if tables else SCHEMAS[data_type].empty_table()
+    ds.write_dataset(
+        table,
+        save_path,
+        format=file_format,
+        partitioning=PARTITIONING,
+        existing_data_behavior="delete_matching",
+    )
+    return table.num_rows
@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain.chat_models import ChatOpenAI
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of latencies kept per backend to estimate its percentiles
+LATENCY_WINDOW = 100
+
+
+def _add_token_usage(total: dict, token_usage: dict):
+    """
+    Adds the token usage of an API call to a total usage, in the same format.
+    """
+    for key in ["prompt_tokens", "completion_tokens"]:
+        if token_usage.get(key):
+            total[key] = total.get(key, 0) + token_usage[key]
+    cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get(
+        "cached_tokens"
+    )
+    if cached_tokens:
+        details = total.setdefault("prompt_tokens_details", {})
+        details["cached_tokens"] = details.get("cached_tokens", 0) + cached_tokens
+    return total
+
+
+class Backend:
+    """
+    It wraps an LLM (an API key, an endpoint or a self-hosted replica) with its
+    health and latency statistics.
+    """
+
+    def __init__(self, name: str, llm, max_failures: int = 3, cooldown: float = 30):
+        """
+        Args:
+            name (str): Name of the backend, used in the logs.
+            llm (ChatOpenAI): The LLM called through this backend.
+            max_failures (int): Number of consecutive failures after which the
+                backend is left aside for the cooldown.
+            cooldown (float): Seconds during which an unhealthy backend is not
+                used, unless no other backend is available.
+        """
+        self.name = name
+        self.llm = llm
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.in_flight = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    def is_healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def percentile(self, quantile: float):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.failures = 0
+            self.unhealthy_until = time.monotonic() + self.cooldown
+            logger.info(f"Backend {self.name} is unhealthy for {self.cooldown}s.")
+
+
+class Dispatcher:
+    """
+    It sends each LLM call to the least loaded healthy backend and, if the answer
+    takes longer than the usual tail latency of that backend (its p95), sends a
+    hedged duplicate of the call to another backend. The first valid answer is
+    used and the slower call is left to finish in the background.
+
+    Since only the calls slower than the p95 are duplicated, about 5% of the calls
+    are sent twice, while the latency of the slowest calls drops to about the p95
+    plus the latency of the hedged call.
+
+    The calls whose answer is not used are billed all the same: the invalid
+    answers with the answer of the call, and the slower calls with the answer of
+    the next call, or with settle() once no other call is to be made.
+    """
+
+    def __init__(
+        self,
+        backends: list,
+        hedge_quantile: float = 0.95,
+        default_hedge_delay: float = 30,
+        min_samples: int = 10,
+        max_hedges: int = 1,
+    ):
+        """
+        Args:
+            backends (list): The backends serving the same model.
+            hedge_quantile (float): Quantile of the latency of a backend after
+                which a hedged call is sent.
+            default_hedge_delay (float): Seconds after which a hedged call is sent
+                while a backend has fewer than min_samples latencies.
+            min_samples (int): Number of latencies needed to use the quantile.
+            max_hedges (int): Maximum number of hedged calls per call.
+        """
+        if not backends:
+            raise ValueError("At least one backend is needed.")
+        self.backends = backends
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.stats = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "rate_limited_hedges": 0,
+            "failures": 0,
+            "invalid": 0,
+            "duplicate_tokens": [0, 0],
+        }
+        self._lock = threading.Lock()
+        # the slower calls left in the background, and the usage of those over
+        # that is not returned to a caller yet
+        self._losers = set()
+        self._unbilled = {}
+        # the losing calls keep running, so there is room for them and the hedges
+        self._executor = ThreadPoolExecutor(max_workers=16 * len(backends))
+
+    def _pick(self, exclude: set, hedge: bool = False):
+        # an unhealthy backend is only used when there is no other way to answer,
+        # never for a hedged call
+        candidates = [b for b in self.backends if b.name not in exclude]
+        healthy = [b for b in candidates if b.is_healthy()]
+        if not healthy and not hedge:
+            healthy = candidates
+        if not healthy:
+            return None
+        return min(healthy, key=lambda b: (b.in_flight, b.percentile(0.5) or 0.0))
+
+    def _hedge_delay(self, backend: Backend):
+        if len(backend.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return backend.percentile(self.hedge_quantile)
+
+    def _call(self, backend: Backend, call):
+        start_time = time.monotonic()
+        try:
+            answer, token_usage = call(backend.llm)
+        except Exception:
+            with self._lock:
+                backend.in_flight -= 1
+                backend.record_failure()
+                self.stats["failures"] += 1
+            raise
+        with self._lock:
+            backend.in_flight -= 1
+            backend.record_success(time.monotonic() - start_time)
+        return answer, token_usage
+
+    def _launch(self, call, pending: dict, tried: set, hedge: bool = False):
+        with self._lock:
+            backend = self._pick(tried, hedge)
+            if backend is None:
+                return None
+            backend.in_flight += 1
+        tried.add(backend.name)
+        pending[self._executor.submit(self._call, backend, call)] = backend
+        return backend
+
+    def _count_duplicate_tokens(self, token_usage: dict):
+        with self._lock:
+            tokens = self.stats["duplicate_tokens"]
+            tokens[0] += token_usage.get("prompt_tokens", 0)
+            tokens[1] += token_usage.get("completion_tokens", 0)
+
+    def _bill_loser(self, future):
+        # the tokens of the calls whose answer was not used are still billed;
+        # called once the call is over, by its callback or by settle()
+        with self._lock:
+            if future not in self._losers:
+                return
+            self._losers.remove(future)
+        if future.exception() is None:
+            token_usage = future.result()[1]
+            self._count_duplicate_tokens(token_usage)
+            with self._lock:
+                _add_token_usage(self._unbilled, token_usage)
+
+    def _take_unbilled(self):
+        with self._lock:
+            unbilled, self._unbilled = self._unbilled, {}
+        return unbilled
+
+    def settle(self):
+        """
+        Waits for the slower calls still running in the background.
+
+        Returns:
+            token_usage (dict): The token usage of the calls whose answer was not
+                used and that was not returned with the answer of a call yet.
+        """
+        with self._lock:
+            losers = list(self._losers)
+        wait(losers)
+        for future in losers:
+            self._bill_loser(future)
+        return self._take_unbilled()
+
+    def run(self, call, validate, rate_limiter=None):
+        """
+        Runs an LLM call on the backends, hedging it when it is slow.
+
+        With a rate limiter, each call waits for it before its clock starts, so
+        the wait counts neither as backend latency nor towards the hedge delay,
+        and a call is only hedged when the limiter allows one more right away.
+
+        Args:
+            call (callable): Takes an LLM and returns its answer and token usage.
+            validate (callable): Takes an answer and returns whether it is valid,
+                e.g. whether it holds a JSON object. An invalid answer is retried
+                on another backend.
+            rate_limiter (RateLimiter): Optional limiter shared by the calls.
+
+        Returns:
+            answer (str): The first valid answer or, if every backend gave an
+                invalid answer, the last one.
+            token_usage (dict): The token usage of the call that gave it, plus the
+                usage of the invalid answers and of the slower calls that ended
+                since the previous call.
+
+        Raises:
+            Exception: The last error, when no backend gave an answer.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+        pending = {}
+        tried = set()
+        hedges = set()
+        if rate_limiter:
+            rate_limiter.acquire()
+        primary = self._launch(call, pending, tried)
+        hedge_at = time.monotonic() + self._hedge_delay(primary)
+        error = None
+        invalid_answer = None
+        invalid_usage = {}
+
+        while pending:
+            can_hedge = hedge_at is not None and len(hedges) < self.max_hedges
+            timeout = max(0.0, hedge_at - time.monotonic()) if can_hedge else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # a hedge only spends the quota left free by the other calls
+                if rate_limiter and not rate_limiter.try_acquire():
+                    with self._lock:
+                        self.stats["rate_limited_hedges"] += 1
+                    hedge_at = None
+                    continue
+                backend = self._launch(call, pending, tried, hedge=True)
+                if backend is None:
+                    hedge_at = None
+                    continue
+                hedges.add(backend.name)
+                with self._lock:
+                    self.stats["hedged"] += 1
+                hedge_at = time.monotonic() + self._hedge_delay(backend)
+                continue
+
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    answer, token_usage = future.result()
+                except Exception as call_error:
+                    logger.info(f"Call to backend {backend.name} failed: {call_error}")
+                    error = call_error
+                else:
+                    if validate(answer):
+                        with self._lock:
+                            self._losers.update(pending)
+                            if backend.name in hedges:
+                                self.stats["hedge_wins"] += 1
+                        for other in pending:
+                            other.add_done_callback(self._bill_loser)
+                        token_usage = _add_token_usage(
+                            _add_token_usage(invalid_usage, self._take_unbilled()),
+                            token_usage,
+                        )
+                        return answer, token_usage
+                    logger.info(f"Invalid answer from backend {backend.name}.")
+                    with self._lock:
+                        self.stats["invalid"] += 1
+                    invalid_answer = answer
+                    _add_token_usage(invalid_usage, token_usage)
+
+            # the failed or invalid call is retried at once on another backend
+            if not pending:
+                if rate_limiter:
+                    rate_limiter.acquire()
+                self._launch(call, pending, tried)
+
+        # an invalid answer is left to the caller, which skips it
+        if invalid_answer is not None:
+            return invalid_answer, _add_token_usage(
+                invalid_usage, self._take_unbilled()
+            )
+        raise error
+
+
+def load_dispatchers(config_path: str):
+    """
+    Creates a dispatcher per model from a JSON configuration such as:
+
+        {
+            "gpt-4": {
+                "hedge_quantile": 0.95,
+                "backends": [
+                    {"name": "key-1", "model_name": "gpt-4"},
+                    {"name": "key-2", "model_name": "gpt-4", "api_key_env": "KEY_2"},
+                    {"name": "azure", "model_name": "gpt-4", "base_url": "[url]"}
+                ]
+            }
+        }
+
+    Besides "backends", a model takes the keyword arguments of Dispatcher. A
+    backend reads its API key from the "api_key_env" environment variable
+    (default: OPENAI_API_KEY) and can set its "request_timeout" in seconds
+    (default: 120) and its "max_retries" (default: 2).
+
+    Returns:
+        dispatchers (dict): model ("gpt-3.5" or "gpt-4") -> Dispatcher.
+    """
+    with open(config_path, "r") as json_file:
+        config = json.load(json_file)
+
+    dispatchers = {}
+    for model, model_config in config.items():
+        settings = dict(model_config)
+        backends = [
+            Backend(
+                backend_config["name"],
+                ChatOpenAI(
+                    model_name=backend_config["model_name"],
+                    openai_api_key=os.environ.get(
+                        backend_config.get("api_key_env", "OPENAI_API_KEY"), "EMPTY"
+                    ),
+                    openai_api_base=backend_config.get("base_url"),
+                    request_timeout=backend_config.get("request_timeout", 120),
+                    max_retries=backend_config.get("max_retries", 2),
+                ),
+            )
+            for backend_config in settings.pop("backends")
+        ]
+        dispatchers[model] = Dispatcher(backends, **settings)
+    return dispatchers
@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+from . import legacy_templates, templates
+from .generic import (
+    TRAIT_MARKERS_PATH,
+    calculate_cost,
+    classify,
+    classify_and_score,
+    score_chunks,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EVAL_PATH = os.path.join(os.getcwd(), "assets")
+
+
+def load_eval_items(data_type: str):
+    """
+    Loads the labeled evaluation items of a data type from assets/, each with
+    its "name", "text", expected "labels" and expected "scores".
+    """
+    with open(os.path.join(EVAL_PATH, f"{data_type}_eval.json"), "r") as json_file:
+        return json.load(json_file)["items"]
+
+
+def _get_templates(data_type: str, module=templates):
+    classification_template = (
+        module.CLASSIFICATION_TEMPLATE_CONV
+        if data_type == "conversations"
+        else module.CLASSIFICATION_TEMPLATE_SRCH
+    )
+    return classification_template, module.SCORE_TEMPLATE
+
+
+def predict_two_pass(text: str, data_type: str, legacy: bool = False):
+    """
+    Classifies the text with gpt-3.5 and scores it with gpt-4, as Enclaveid.score
+    does. Unlike the pipeline, the text is scored whatever its labels, so that
+    every evaluation item gets scores to compare.
+
+    Args:
+        text (str): The text of an evaluation item.
+        data_type (str): "conversations" or "searches".
+        legacy (bool): Whether to use the prompts as they were before their
+            variable parts were moved last, see utils.legacy_templates.
+
+    Returns:
+        prediction (dict): The "labels", the "scores" and the "cost" in USD.
+    """
+    classification_template, score_template = _get_templates(
+        data_type, legacy_templates if legacy else templates
+    )
+    classified_items, *classification_tokens = classify(
+        [text], mode=data_type, template=classification_template
+    )
+    if not classified_items:
+        return {"labels": None, "scores": None, "cost": 0.0}
+
+    scores, *scoring_tokens, _ = score_chunks(classified_items, template=score_template)
+    cost = calculate_cost({"gpt-3.5": classification_tokens, "gpt-4": scoring_tokens})
+    return {
+        "labels": classified_items[0]["labels"],
+        "scores": scores[0] if scores else None,
+        "cost": cost,
+    }
+
+
+def _count_lines(prompt: str):
+    return Counter(line for line in prompt.splitlines() if line.strip())
+
+
+def compare_prompts(items: list, data_type: str):
+    """
+    Renders the legacy and the current prompts of each evaluation item and
+    compares their lines, to check that the prompts only differ in the order of
+    their parts. It makes no LLM call.
+
+    Args:
+        items (list): The evaluation items, see load_eval_items.
+        data_type (str): "conversations" or "searches".
+
+    Returns:
+        comparison (dict): For the "classification" and "score" prompts, whether
+            they have the "same_lines" for every item, and the lines found
+            "only_in_legacy" and "only_in_current".
+    """
+    with open(TRAIT_MARKERS_PATH, "r") as json_file:
+        markers = json.load(json_file)[data_type]
+
+    comparison = {}
+    for name, legacy_template, current_template in zip(
+        ["classification", "score"],
+        _get_templates(data_type, legacy_templates),
+        _get_templates(data_type),
+    ):
+        only_in_legacy = set()
+        only_in_current = set()
+        for item in items:
+            variables = (
+                {"markers": markers, "text": item["text"]}
+                if name == "classification"
+                # the labels are left as they are in the template, so that the
+                # lines of the prompts do not differ from one item to the next
+                else {"labels": "{labels}", "text": item["text"]}
+            )
+            legacy_lines = _count_lines(legacy_template.format(**variables))
+            current_lines = _count_lines(current_template.format(**variables))
+            only_in_legacy.update(legacy_lines - current_lines)
+            only_in_current.update(current_lines - legacy_lines)
+        comparison[name] = {
+            "same_lines": not only_in_legacy and not only_in_current,
+            "only_in_legacy": sorted(only_in_legacy),
+            "only_in_current": sorted(only_in_current),
+        }
+    return comparison
+
+
+def predict_fused(text: str, data_type: str, model: str = "gpt-4-turbo"):
+    """
+    Classifies and scores the text in a single call, as Enclaveid.alternative_score
+    does.
+
+    Returns:
+        prediction (dict): The "labels", the "scores" and the "cost" in USD.
+    """
+    classified_items, *tokens = classify_and_score([text], mode=data_type, model=model)
+    cost = calculate_cost({model: tokens})
+    if not classified_items:
+        return {"labels": None, "scores": None, "cost": cost}
+    return {
+        "labels": classified_items[0]["labels"],
+        "scores": classified_items[0]["scores"],
+        "cost": cost,
+    }
+
+
+def _summarize(items: list, results: list):
+    matches = 0
+    labels_count = 0
+    errors = []
+    for item, result in zip(items, results):
+        if result["labels"]:
+            for trait, level in item["labels"].items():
+                labels_count += 1
+                matches += str(result["labels"].get(trait, "")).lower() == level
+        if result["scores"]:
+            errors.extend(
+                abs(float(result["scores"][trait]) - expected)
+                for trait, expected in item["scores"].items()
+                if trait in result["scores"]
+            )
+
+    latencies = [result["latency"] for result in results]
+    return {
+        "items": len(results),
+        "failed": sum(not result["scores"] for result in results),
+        "label_accuracy": round(matches / labels_count, 3) if labels_count else None,
+        "score_mae": round(sum(errors) / len(errors), 3) if errors else None,
+        "cost": round(sum(result["cost"] for result in results), 4),
+        "total_latency": round(sum(latencies), 2),
+        "mean_latency": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+    }
+
+
+def compare_results(results: list, other_results: list):
+    """
+    Compares the answers of two runs on the same evaluation items.
+
+    Returns:
+        comparison (dict): The share of the labels that are the same in both runs,
+            and the mean and the maximum absolute difference of the scores.
+    """
+    same_labels = 0
+    labels_count = 0
+    differences = []
+    for result, other in zip(results, other_results):
+        if result["labels"] and other["labels"]:
+            for trait, level in result["labels"].items():
+                labels_count += 1
+                same_labels += (
+                    str(level).lower() == str(other["labels"].get(trait, "")).lower()
+                )
+        if result["scores"] and other["scores"]:
+            differences.extend(
+                abs(float(score) - float(other["scores"][trait]))
+                for trait, score in result["scores"].items()
+                if trait in other["scores"]
+            )
+
+    return {
+        "same_labels": (round(same_labels / labels_count, 3) if labels_count else None),
+        "mean_score_difference": (
+            round(sum(differences) / len(differences), 3) if differences else None
+        ),
+        "max_score_difference": (round(max(differences), 3) if differences else None),
+    }
+
+
+def evaluate(predict, items: list):
+    """
+    Runs a pipeline on the evaluation items and compares its answers with the
+    expected ones.
+
+    Args:
+        predict (callable): Takes the text of an item and returns its prediction,
+            as predict_two_pass and predict_fused do.
+        items (list): The evaluation items, see load_eval_items.
+
+    Returns:
+        evaluation (dict): The "summary" of the run (label accuracy, mean absolute
+            error of the scores, cost and latency) and the results of the "items".
+    """
+    results = []
+    for item in items:
+        start_time = time.perf_counter()
+        prediction = predict(item["text"])
+        latency = time.perf_counter() - start_time
+        logger.info(f"Evaluated {item['name']} in {latency:.2f}s: {prediction}")
+        results.append(
+            {"name": item["name"], "latency": round(latency, 2), **prediction}
+        )
+
+    return {"summary": _summarize(items, results), "items": results}
@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import random
 
 import json_repair
 import tiktoken
@@ -8,14 +9,30 @@ from langchain.chains import LLMChain
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
 
+from .dispatch import Dispatcher
+from .sampling import confidence_interval_widths
 from .templates import (
     CLASSIFICATION_TEMPLATE_CONV,
     CLASSIFICATION_TEMPLATE_SRCH,
+    CLASSIFY_AND_SCORE_TEMPLATE,
     SCORE_TEMPLATE,
 )
 
 TRAIT_MARKERS_PATH = os.path.join(os.getcwd(), "assets/markers.json")
 
+# Minimum number of scores before early stopping can end the scoring, so that a
+# few similar first scores are not mistaken for convergence
+MIN_SCORES_BEFORE_STOPPING = 5
+
+# Score returned when there is no chunk to score
+DEFAULT_SCORE = {
+    "openness": 0.5,
+    "conscientiousness": 0.5,
+    "extraversion": 0.5,
+    "agreeableness": 0.5,
+    "neuroticism": 0.5,
+}
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,33 +42,147 @@ httpx_logger = logging.getLogger("httpx")
 httpx_logger.setLevel(logging.WARNING)
 
 
-def calculate_cost(token_data: int):
+# Prices in USD per 1K input and output tokens, as of Dec 16th, 2023
+PRICES = {
+    "gpt-3.5": (0.0010, 0.0020),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+}
+
+# OpenAI model of each priced model, and the ones supporting the JSON output mode
+MODEL_NAMES = {
+    "gpt-3.5": "gpt-3.5-turbo-1106",
+    "gpt-4": "gpt-4",
+    "gpt-4-turbo": "gpt-4-1106-preview",
+}
+JSON_MODE_MODELS = ["gpt-3.5", "gpt-4-turbo"]
+
+# Input tokens read from the provider's prompt cache are billed at a discount
+CACHED_INPUT_PRICE_RATIO = 0.5
+
+
+def calculate_cost(token_data: dict):
     """
     Calculates the cost according to the number of tokens used.
     Pricing as of Dec 16th, 2023: https://openai.com/pricing
 
     Args:
-        token_data (int): The number of tokens used.
+        token_data (dict): The number of input and output tokens used per model,
+            optionally followed by the number of input tokens read from the
+            prompt cache, e.g. {"gpt-4": [input, output, cached]}.
 
     Returns:
         cost (float): The total cost in USD, rounded to four decimal places.
     """
     cost = 0
-    if "gpt-3.5" in token_data:
-        gpt_3_cost = (token_data["gpt-3.5"][0] / 1000 * 0.0010) + (
-            token_data["gpt-3.5"][1] / 1000 * 0.0020
-        )
-        cost += gpt_3_cost
-
-    if "gpt-4" in token_data:
-        gpt_4_cost = (token_data["gpt-4"][0] / 1000 * 0.03) + (
-            token_data["gpt-4"][1] / 1000 * 0.06
-        )
-        cost += gpt_4_cost
+    for model in PRICES:
+        if model in token_data:
+            cost += _get_tokens_cost(model, *token_data[model])
 
     return round(cost, 4)
 
 
+def _get_tokens_cost(model: str, input_tokens, output_tokens, cached_tokens=0):
+    input_price, output_price = PRICES[model]
+    return (
+        (input_tokens - cached_tokens) / 1000 * input_price
+        + cached_tokens / 1000 * input_price * CACHED_INPUT_PRICE_RATIO
+        + output_tokens / 1000 * output_price
+    )
+
+
+# Typical number of tokens of the answers, with their step by step explanation,
+# and share of chunks with at least one trait classified as high. Used to
+# estimate the cost of a run before making any call.
+EXPECTED_OUTPUT_TOKENS = 400
+EXPECTED_HIGH_CLASSIFIED_RATIO = 0.3
+TRAIT_LABELS_EXAMPLE = {
+    "openness": "high",
+    "conscientiousness": "medium",
+    "extraversion": "low",
+    "agreeableness": "medium",
+    "neuroticism": "none",
+}
+
+
+def get_cached_rate(token_data: dict):
+    """
+    Calculates the share of input tokens that were read from the prompt cache.
+
+    Args:
+        token_data (dict): The tokens used per model, as in calculate_cost.
+
+    Returns:
+        rate (float): The cached input tokens over the input tokens, from 0 to 1.
+    """
+    input_tokens = sum(tokens[0] for tokens in token_data.values())
+    cached_tokens = sum(tokens[2] for tokens in token_data.values() if len(tokens) > 2)
+    return cached_tokens / input_tokens if input_tokens else 0.0
+
+
+class Budget:
+    """
+    It keeps track of the cost of the LLM calls made against a maximum cost, so
+    that a pipeline can stop before going over it.
+    """
+
+    def __init__(self, max_cost: float = None):
+        self.max_cost = max_cost
+        self.cost = 0.0
+
+    def add(self, model: str, input_tokens, output_tokens, cached_tokens=0):
+        self.cost += _get_tokens_cost(model, input_tokens, output_tokens, cached_tokens)
+
+    def can_afford(self, estimated_cost: float):
+        return self.max_cost is None or self.cost + estimated_cost <= self.max_cost
+
+
+def estimate_call_cost(model: str, input_text: str):
+    """
+    Estimates the cost of an LLM call before making it, from the number of tokens
+    of its input and the typical length of the answers.
+    """
+    return _get_tokens_cost(
+        model, _get_number_of_tokens(input_text), EXPECTED_OUTPUT_TOKENS
+    )
+
+
+def estimate_cost(chunks: list, mode: str):
+    """
+    Estimates the cost of classifying the given chunks and of scoring the ones
+    expected to be classified as high.
+
+    Args:
+        chunks (list): A list of chunks to be classified.
+        mode (str): A string defining the data type "conversations" or "searches".
+
+    Returns:
+        classification_cost (float): The estimated cost of classifying the chunks.
+        scoring_cost (float): The estimated cost of scoring the high-classified
+            chunks among them.
+    """
+    with open(TRAIT_MARKERS_PATH, "r") as json_file:
+        markers = json.load(json_file)
+    classification_template = (
+        CLASSIFICATION_TEMPLATE_CONV
+        if mode == "conversations"
+        else CLASSIFICATION_TEMPLATE_SRCH
+    )
+    classification_prompt = classification_template.format(
+        markers=markers[mode], text=""
+    )
+    score_prompt = SCORE_TEMPLATE.format(labels=TRAIT_LABELS_EXAMPLE, text="")
+
+    classification_cost = 0.0
+    scoring_cost = 0.0
+    for chunk in chunks:
+        classification_cost += estimate_call_cost(
+            "gpt-3.5", classification_prompt + chunk
+        )
+        scoring_cost += estimate_call_cost("gpt-4", score_prompt + chunk)
+    return classification_cost, scoring_cost * EXPECTED_HIGH_CLASSIFIED_RATIO
+
+
 def _get_number_of_tokens(text: str):
     """
     Counts the number of tokens in the input text.
@@ -161,6 +292,194 @@ def generate_chunks(data: list, max_tokens: int = 2048):
     return chunks
 
 
+def _fit_to_max_tokens(item: str, max_tokens: int):
+    """
+    Splits a data item until every piece fits within max_tokens.
+
+    Returns:
+        pieces (list): A list of (piece, number of tokens) tuples.
+    """
+    pieces = []
+    pending = [item]
+    while pending:
+        piece = pending.pop(0)
+        tokens = _get_number_of_tokens(piece)
+        if tokens <= max_tokens:
+            pieces.append((piece, tokens))
+        else:
+            max_chars = max(2, len(piece) * max_tokens // tokens)
+            pending = _split_string(piece, max_chars) + pending
+    return pieces
+
+
+def _join_pieces(pieces: list, max_tokens: int):
+    # The tokens of the joined pieces are counted again, and the last pieces are
+    # moved to their own chunk on the rare occasions the separators go over.
+    chunk = " ".join(pieces)
+    tokens = _get_number_of_tokens(chunk)
+    if tokens <= max_tokens or len(pieces) == 1:
+        return [(chunk, tokens)]
+    return _join_pieces(pieces[:-1], max_tokens) + _join_pieces(pieces[-1:], max_tokens)
+
+
+def pack_chunks(
+    data: list, max_tokens: int = 2048, localities: list = None, window: int = 1
+):
+    """
+    Packs data items into as few chunks as possible with first-fit-decreasing bin
+    packing. Unlike generate_chunks, no chunk ever goes over max_tokens.
+
+    An item is only packed with the items of its locality (e.g. the same
+    participants or the same day) or of the window - 1 previous localities, so
+    that each chunk keeps a coherent context. Within a chunk, the items keep their
+    original order.
+
+    Args:
+        data (list): A list of data items, where each data item is a string.
+        max_tokens (int): The maximum number of tokens of each chunk.
+        localities (list): The locality of each data item. Consecutive items with
+            the same locality form a group. Default: all the items form one group.
+        window (int): The number of consecutive groups whose items can share a
+            chunk.
+
+    Returns:
+        chunks (list): A list of chunks, each a string of up to max_tokens tokens.
+        fill_ratio (float): The share of the tokens of the chunks that is used.
+    """
+    if localities is None:
+        localities = [None] * len(data)
+
+    groups = []
+    position = 0
+    for index, (item, locality) in enumerate(zip(data, localities)):
+        if not groups or locality != localities[index - 1]:
+            groups.append([])
+        for piece, tokens in _fit_to_max_tokens(item, max_tokens):
+            groups[-1].append((tokens, position, piece))
+            position += 1
+
+    bins = []
+    open_bins = []
+    for group_index, group in enumerate(groups):
+        open_bins = [b for b in open_bins if b["group"] > group_index - window]
+        for tokens, position, piece in sorted(group, key=lambda p: -p[0]):
+            # every piece but the first one of a chunk comes with a separator
+            chunk_bin = next(
+                (b for b in open_bins if b["tokens"] + 1 + tokens <= max_tokens),
+                None,
+            )
+            if chunk_bin is None:
+                chunk_bin = {"group": group_index, "tokens": tokens, "pieces": []}
+                bins.append(chunk_bin)
+                open_bins.append(chunk_bin)
+            else:
+                chunk_bin["tokens"] += 1 + tokens
+            chunk_bin["pieces"].append((position, piece))
+
+    chunks = []
+    used_tokens = 0
+    for chunk_bin in bins:
+        pieces = [piece for _, piece in sorted(chunk_bin["pieces"])]
+        for chunk, tokens in _join_pieces(pieces, max_tokens):
+            chunks.append(chunk)
+            used_tokens += tokens
+
+    fill_ratio = used_tokens / (len(chunks) * max_tokens) if chunks else 0.0
+    return chunks, fill_ratio
+
+
+# Rate limiter shared by all the LLM calls of the process, see set_rate_limiter
+_rate_limiter = None
+
+
+def set_rate_limiter(rate_limiter):
+    """
+    Makes every LLM call of this process wait for the given rate limiter, e.g. a
+    utils.parallel.RateLimiter shared with the other processes of a run. None
+    removes the limit.
+    """
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def _create_chain(model_name: str, prompt: PromptTemplate, dispatcher: Dispatcher):
+    """
+    Creates the LLM chain of a prompt. With a dispatcher, the calls go to its
+    backends, so the chain holds the LLM of a backend instead of an OpenAI
+    client, which would require an OpenAI API key.
+    """
+    if dispatcher:
+        return LLMChain(llm=dispatcher.backends[0].llm, prompt=prompt)
+    return LLMChain(llm=ChatOpenAI(model_name=model_name), prompt=prompt)
+
+
+def _run_chain(chain: LLMChain, inputs: dict, dispatcher: Dispatcher = None):
+    """
+    Runs an LLM chain on the given inputs. With a dispatcher, the call is sent to
+    its backends instead of the LLM of the chain, and hedged when it is slow. The
+    calls wait for the rate limiter if one is set.
+
+    Returns:
+        answer (str): The output text of the LLM.
+        token_usage (dict): The token usage reported by the API, if any.
+    """
+    if dispatcher:
+        # the dispatcher waits for the limiter before starting the clock of a call
+        return dispatcher.run(
+            lambda llm: _generate(LLMChain(llm=llm, prompt=chain.prompt), inputs),
+            validate=_extract_json,
+            rate_limiter=_rate_limiter,
+        )
+
+    if _rate_limiter:
+        _rate_limiter.acquire()
+    return _generate(chain, inputs)
+
+
+def _generate(chain: LLMChain, inputs: dict):
+    result = chain.generate([inputs])
+    answer = result.generations[0][0].text
+    token_usage = (result.llm_output or {}).get("token_usage") or {}
+    return answer, token_usage
+
+
+def _count_tokens(token_usage: dict, input_text: str, output_text: str):
+    """
+    Counts the tokens of an LLM call from the usage reported by the API, falling
+    back to tokenizing the texts when the API does not report it.
+
+    Returns:
+        input_tokens (int): The number of tokens sent to the LLM.
+        output_tokens (int): The number of tokens in the output from the LLM.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
+    """
+    input_tokens = token_usage.get("prompt_tokens") or _get_number_of_tokens(
+        input_text
+    )
+    output_tokens = token_usage.get("completion_tokens") or _get_number_of_tokens(
+        output_text
+    )
+    details = token_usage.get("prompt_tokens_details") or {}
+    cached_tokens = details.get("cached_tokens") or 0
+    return input_tokens, output_tokens, cached_tokens
+
+
+def _settle_dispatcher(dispatcher: Dispatcher):
+    """
+    Waits for the hedged calls of a dispatcher still running in the background,
+    whose tokens are billed even though their answer is not used.
+
+    Returns:
+        input_tokens (int): The number of tokens sent to the LLM.
+        output_tokens (int): The number of tokens in the output from the LLM.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
+    """
+    token_usage = dispatcher.settle()
+    if not token_usage:
+        return 0, 0, 0
+    return _count_tokens(token_usage, "", "")
+
+
 def remove_low_classified_chunks(labels: list):
     """
     Removes chunks that do not have any trait labeled with a high signal.
@@ -181,7 +500,13 @@ def remove_low_classified_chunks(labels: list):
     return high_labeled_items
 
 
-def classify(chunks: list, mode: str):
+def classify(
+    chunks: list,
+    mode: str,
+    budget: Budget = None,
+    dispatcher: Dispatcher = None,
+    template: str = None,
+):
     """
     Classifies each conversation or search history with signals of the five OCEAN
     traits as high, medium, low, or none, using OpenAI's LLM.
@@ -190,23 +515,31 @@ def classify(chunks: list, mode: str):
         chunks (list): A list of strings representing either conversations or search
             history.
         mode (str): A string defining the data type "conversations" or "searches".
+        budget (Budget): Optional budget. The classification stops before the
+            first call that would go over it.
+        dispatcher (Dispatcher): Optional dispatcher spreading the calls over
+            several backends, see utils.dispatch.
+        template (str): Optional classification template replacing the one of
+            the data type, e.g. to evaluate another prompt.
 
     Returns:
         classified_items (list): A list of dictionaries, each containing the chunk text
         and its corresponding OCEAN traits labels.
         input_tokens (int): The number of tokens sent to the LLM.
         output_tokens (int): The number of tokens in the output from the LLM.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
     """
+    if template is None:
+        template = (
+            CLASSIFICATION_TEMPLATE_CONV
+            if mode == "conversations"
+            else CLASSIFICATION_TEMPLATE_SRCH
+        )
     classification_prompt = PromptTemplate(
-        input_variables=["markers", "text"],
-        template=CLASSIFICATION_TEMPLATE_CONV
-        if mode == "conversations"
-        else CLASSIFICATION_TEMPLATE_SRCH,
+        input_variables=["markers", "text"], template=template
     )
 
-    chain = LLMChain(
-        llm=ChatOpenAI(model_name="gpt-3.5-turbo-1106"), prompt=classification_prompt
-    )
+    chain = _create_chain("gpt-3.5-turbo-1106", classification_prompt, dispatcher)
 
     with open(TRAIT_MARKERS_PATH, "r") as json_file:
         markers = json.load(json_file)
@@ -214,15 +547,26 @@ def classify(chunks: list, mode: str):
     classified_items = []
     input_tokens = 0
     output_tokens = 0
+    cached_tokens = 0
 
     for chunk in chunks:
         input_text = str(
             classification_prompt.format(markers=markers[mode], text=chunk)
         )
-        input_tokens += _get_number_of_tokens(input_text)
+        if budget and not budget.can_afford(estimate_call_cost("gpt-3.5", input_text)):
+            logger.info("Stopping the classification: the budget is used up.")
+            break
+
+        output_text, token_usage = _run_chain(
+            chain, {"markers": markers[mode], "text": chunk}, dispatcher
+        )
 
-        output_text = chain.run({"markers": markers[mode], "text": chunk})
-        output_tokens += _get_number_of_tokens(output_text)
+        tokens = _count_tokens(token_usage, input_text, output_text)
+        input_tokens += tokens[0]
+        output_tokens += tokens[1]
+        cached_tokens += tokens[2]
+        if budget:
+            budget.add("gpt-3.5", *tokens)
 
         labels = _extract_json(output_text)
 
@@ -233,7 +577,15 @@ def classify(chunks: list, mode: str):
 
             classified_items.append({"text": chunk, "labels": labels})
 
-    return classified_items, input_tokens, output_tokens
+    if dispatcher:
+        tokens = _settle_dispatcher(dispatcher)
+        input_tokens += tokens[0]
+        output_tokens += tokens[1]
+        cached_tokens += tokens[2]
+        if budget:
+            budget.add("gpt-3.5", *tokens)
+
+    return classified_items, input_tokens, output_tokens, cached_tokens
 
 
 def _extract_json(gpt_answer: str):
@@ -285,50 +637,80 @@ def _calculate_scores_average(scores_list: list):
     return averages
 
 
-def score_items(items: list):
+def score_chunks(
+    items: list,
+    budget: Budget = None,
+    ci_width: float = None,
+    seed: int = 0,
+    dispatcher: Dispatcher = None,
+    template: str = SCORE_TEMPLATE,
+):
     """
     Scores the OCEAN traits on a scale from 0 to 1 for each given chunk of data.
 
     Args:
-        items (list): A list of chunks to be scored.
+        items (list): A list of classified chunks to be scored.
+        budget (Budget): Optional budget. The scoring stops before the first call
+            that would go over it.
+        ci_width (float): Optional early stopping. The chunks are scored in a
+            random order and the scoring stops as soon as the 95% confidence
+            interval of the mean score of every trait is narrower than ci_width.
+        seed (int): Seed of the random order used with early stopping.
+        dispatcher (Dispatcher): Optional dispatcher spreading the calls over
+            several backends, see utils.dispatch.
+        template (str): The score template, e.g. another prompt to evaluate.
 
     Returns:
-        final_score (dict): A dictionary containing the scores for each of the five
-            OCEAN traits.
+        scores (list): A list of dictionaries, each containing the scores of the
+            five OCEAN traits for one chunk.
         input_tokens (int): The number of tokens sent to the LLM.
         output_tokens (int): The number of tokens in the output from the LLM.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
+        early_stopping (dict): With ci_width, the number of chunks scored before
+            the scores converged and the number and estimated cost of the gpt-4
+            calls skipped, else None.
     """
     input_tokens = 0
     output_tokens = 0
+    cached_tokens = 0
+    early_stopping = None
 
     score_prompt = PromptTemplate(
         input_variables=["text", "labels"],
-        template=SCORE_TEMPLATE,
+        template=template,
     )
 
-    chain = LLMChain(llm=ChatOpenAI(model_name="gpt-4"), prompt=score_prompt)
-
-    if not items:
-        return (
-            {
-                "openness": 0.5,
-                "conscientiousness": 0.5,
-                "extraversion": 0.5,
-                "agreeableness": 0.5,
-                "neuroticism": 0.5,
-            },
-            0,
-            0,
-        )
+    chain = _create_chain("gpt-4", score_prompt, dispatcher)
+
+    if ci_width is not None:
+        items = random.Random(seed).sample(items, len(items))
+        early_stopping = _get_early_stopping(score_prompt, items, len(items))
 
     scores_per_range = []
-    for item in items:
+    for index, item in enumerate(items):
         _input_text = str(score_prompt.format(text=item["text"], labels=item["labels"]))
-        input_tokens += _get_number_of_tokens(_input_text)
+        if budget and not budget.can_afford(estimate_call_cost("gpt-4", _input_text)):
+            logger.info("Stopping the scoring: the budget is used up.")
+            break
+        if ci_width is not None and _has_converged(scores_per_range, ci_width):
+            early_stopping = _get_early_stopping(score_prompt, items, index)
+            logger.info(
+                f"The scores converged after {index} out of {len(items)} chunks. "
+                f"Skipped {early_stopping['skipped_calls']} gpt-4 calls, saving "
+                f"about {early_stopping['saved_cost']} USD."
+            )
+            break
 
-        score = chain.run({"text": item["text"], "labels": item["labels"]})
+        score, token_usage = _run_chain(
+            chain, {"text": item["text"], "labels": item["labels"]}, dispatcher
+        )
 
-        output_tokens += _get_number_of_tokens(score)
+        tokens = _count_tokens(token_usage, _input_text, score)
+        input_tokens += tokens[0]
+        output_tokens += tokens[1]
+        cached_tokens += tokens[2]
+        if budget:
+            budget.add("gpt-4", *tokens)
         score = _extract_json(score)
 
         if score:
@@ -340,11 +722,174 @@ def score_items(items: list):
 
             scores_per_range.append(score)
 
+    if dispatcher:
+        tokens = _settle_dispatcher(dispatcher)
+        input_tokens += tokens[0]
+        output_tokens += tokens[1]
+        cached_tokens += tokens[2]
+        if budget:
+            budget.add("gpt-4", *tokens)
+
+    return scores_per_range, input_tokens, output_tokens, cached_tokens, early_stopping
+
+
+def _has_converged(scores: list, ci_width: float):
+    if len(scores) < MIN_SCORES_BEFORE_STOPPING:
+        return False
+    widths = confidence_interval_widths(scores)
+    return all(width < ci_width for width in widths.values())
+
+
+def _get_early_stopping(score_prompt: PromptTemplate, items: list, scored: int):
+    skipped = items[scored:]
+    saved_cost = sum(
+        estimate_call_cost(
+            "gpt-4", score_prompt.format(text=item["text"], labels=item["labels"])
+        )
+        for item in skipped
+    )
+    return {
+        "converged": scored < len(items),
+        "chunks_before_convergence": scored,
+        "skipped_calls": len(skipped),
+        "saved_cost": round(saved_cost, 4),
+    }
+
+
+def score_items(
+    items: list,
+    budget: Budget = None,
+    ci_width: float = None,
+    dispatcher: Dispatcher = None,
+):
+    """
+    Scores the OCEAN traits on a scale from 0 to 1 for each given chunk of data,
+    and averages the scores of all the chunks.
+
+    Args:
+        items (list): A list of chunks to be scored.
+        budget (Budget): Optional budget, see score_chunks.
+        ci_width (float): Optional early stopping, see score_chunks.
+        dispatcher (Dispatcher): Optional dispatcher, see score_chunks.
+
+    Returns:
+        final_score (dict): A dictionary containing the scores for each of the five
+            OCEAN traits.
+        input_tokens (int): The number of tokens sent to the LLM.
+        output_tokens (int): The number of tokens in the output from the LLM.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
+        early_stopping (dict): The early stopping summary, see score_chunks.
+    """
+    scores_per_range, *tokens, early_stopping = score_chunks(
+        items, budget=budget, ci_width=ci_width, dispatcher=dispatcher
+    )
+
+    if not scores_per_range:
+        return dict(DEFAULT_SCORE), *tokens, early_stopping
+
     if len(scores_per_range) == 1:
-        return scores_per_range[0], input_tokens, output_tokens
+        return scores_per_range[0], *tokens, early_stopping
 
     final_score = _calculate_scores_average(scores_per_range)
-    return final_score, input_tokens, output_tokens
+    return final_score, *tokens, early_stopping
+
+
+def _parse_classification_and_scores(answer: str):
+    """
+    Parses the JSON answer of a classify-and-score call.
+
+    Returns:
+        parsed_answer (dict): The "explanation", the "labels" and the float "scores"
+            of the five traits, or an empty dict if the answer is invalid.
+    """
+    start_index = answer.find("{")
+    end_index = answer.rfind("}")
+    try:
+        parsed_answer = json_repair.loads(answer[start_index : end_index + 1])
+        labels = {
+            trait: str(parsed_answer["labels"][trait]).lower()
+            for trait in DEFAULT_SCORE
+        }
+        scores = {
+            trait: float(parsed_answer["scores"][trait]) for trait in DEFAULT_SCORE
+        }
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        logger.info(f"Invalid answer format: {answer}")
+        return {}
+
+    return {
+        "explanation": parsed_answer.get("explanation", ""),
+        "labels": labels,
+        "scores": scores,
+    }
+
+
+def classify_and_score(chunks: list, mode: str, model: str = "gpt-4-turbo"):
+    """
+    Classifies each conversation or search history with signals of the five OCEAN
+    traits and scores them from 0 to 1 in a single LLM call, instead of a
+    classification call followed by a scoring call.
+
+    Args:
+        chunks (list): A list of strings representing either conversations or search
+            history.
+        mode (str): A string defining the data type "conversations" or "searches".
+        model (str): The model to use, one of "gpt-3.5", "gpt-4" or "gpt-4-turbo".
+
+    Returns:
+        classified_items (list): A list of dictionaries, each containing the chunk text,
+        its OCEAN traits labels and its scores.
+        input_tokens (int): The number of tokens sent to the LLM.
+        output_tokens (int): The number of tokens in the output from the LLM.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
+    """
+    if model not in MODEL_NAMES:
+        raise ValueError(f"Model {model} is not supported. We support {list(PRICES)}.")
+
+    prompt = PromptTemplate(
+        input_variables=["markers", "text"], template=CLASSIFY_AND_SCORE_TEMPLATE
+    )
+    # The JSON output mode guarantees a parsable answer on the models supporting it
+    model_kwargs = (
+        {"response_format": {"type": "json_object"}}
+        if model in JSON_MODE_MODELS
+        else {}
+    )
+    chain = LLMChain(
+        llm=ChatOpenAI(model_name=MODEL_NAMES[model], model_kwargs=model_kwargs),
+        prompt=prompt,
+    )
+
+    with open(TRAIT_MARKERS_PATH, "r") as json_file:
+        markers = json.load(json_file)
+
+    classified_items = []
+    input_tokens = 0
+    output_tokens = 0
+    cached_tokens = 0
+
+    for chunk in chunks:
+        input_text = str(prompt.format(markers=markers[mode], text=chunk))
+        output_text, token_usage = _run_chain(
+            chain, {"markers": markers[mode], "text": chunk}
+        )
+
+        tokens = _count_tokens(token_usage, input_text, output_text)
+        input_tokens += tokens[0]
+        output_tokens += tokens[1]
+        cached_tokens += tokens[2]
+
+        answer = _parse_classification_and_scores(output_text)
+
+        if answer:
+            logging.info(f"Classifying and scoring text: {chunk}")
+            logging.info(f"LLM reasoning: {answer['explanation']}")
+
+            classified_items.append(
+                {"text": chunk, "labels": answer["labels"], "scores": answer["scores"]}
+            )
+
+    return classified_items, input_tokens, output_tokens, cached_tokens
 
 
 def save_json(save_path: str, information: dict):
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+import json_repair
+
+from .templates import INTENT_CLUSTERING_TEMPLATE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# disable requests default logging inherent from openai
+httpx_logger = logging.getLogger("httpx")
+httpx_logger.setLevel(logging.WARNING)
+
+DEFAULT_MODEL = "gpt-4-1106-preview"
+INTENT_TYPES = ["reactive", "proactive"]
+INTENT_FIELDS = ["title", "description", "time_start", "time_end"]
+
+
+class ClusteringError(Exception):
+    """Raised when the LLM answer does not follow the intents schema."""
+
+
+def _parse_answer(answer: str):
+    """
+    Parses the JSON answer of the LLM into the intents of the day, checking that
+    they follow summarization-benchmark/schema.json.
+
+    Returns:
+        intents (dict): The "reactive" and "proactive" intents.
+        analysis (str): The description of the day given by the LLM.
+    """
+    try:
+        parsed_answer = json_repair.loads(answer[answer.find("{") :])
+    except json.JSONDecodeError as error:
+        raise ClusteringError(f"Answer is not a JSON object: {answer}") from error
+    if not isinstance(parsed_answer, dict):
+        raise ClusteringError(f"Answer is not a JSON object: {answer}")
+
+    intents = {}
+    for intent_type in INTENT_TYPES:
+        items = parsed_answer.get(intent_type)
+        if not isinstance(items, list):
+            raise ClusteringError(f"Answer has no {intent_type} array: {answer}")
+        for item in items:
+            if not isinstance(item, dict) or any(
+                field not in item for field in INTENT_FIELDS
+            ):
+                raise ClusteringError(f"Invalid {intent_type} intent: {item}")
+        intents[intent_type] = [
+            {field: item[field] for field in INTENT_FIELDS} for item in items
+        ]
+    return intents, str(parsed_answer.get("analysis", ""))
+
+
+def _hash_day(model: str, text: str):
+    digest = hashlib.sha256()
+    for part in (INTENT_CLUSTERING_TEMPLATE, model, text):
+        digest.update(part.encode("utf8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _load_json(file_path: str):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r") as json_file:
+        return json.load(json_file)
+
+
+def _save_json(file_path: str, information: dict):
+    # write to a temporary file first, so a file only exists once complete
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w") as json_file:
+        json.dump(information, json_file, indent=2)
+    os.replace(temp_path, file_path)
+
+
+class IntentClusterer:
+    """
+    It clusters the search history of each day into reactive and proactive
+    intents with an OpenAI-compatible endpoint.
+
+    Each day takes a single call with a JSON output, which describes the day,
+    clusters it and classifies the clusters at once, instead of three calls that
+    each send the search history again. Days run concurrently, and each one is
+    saved as soon as it is done along with the hash of its input, so a day is
+    only clustered again when its search history changes.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str = DEFAULT_MODEL,
+        max_concurrency: int = 16,
+        max_attempts: int = 3,
+        json_mode: bool = True,
+    ):
+        """
+        Args:
+            client (AsyncOpenAI): The client of the endpoint.
+            model (str): Model name.
+            max_concurrency (int): Maximum number of requests in flight.
+            max_attempts (int): Maximum number of attempts for each day.
+            json_mode (bool): Whether to ask for the JSON output mode, for the
+                endpoints that support it.
+        """
+        self.client = client
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.json_mode = json_mode
+        self.stats = {
+            "done": 0,
+            "cached": 0,
+            "failed": [],
+            "retried": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    async def cluster_day(self, text: str):
+        """
+        Clusters the search history of a day into intents.
+
+        Returns:
+            intents (dict): The "reactive" and "proactive" intents.
+            analysis (str): The description of the day given by the LLM.
+        """
+        kwargs = {"response_format": {"type": "json_object"}} if self.json_mode else {}
+        async with self.semaphore:
+            answer = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a helpful assistant designed to output "
+                        "JSON.",
+                    },
+                    {"role": "user", "content": INTENT_CLUSTERING_TEMPLATE + text},
+                ],
+                **kwargs,
+            )
+        if answer.usage:
+            self.stats["input_tokens"] += answer.usage.prompt_tokens
+            self.stats["output_tokens"] += answer.usage.completion_tokens
+
+        return _parse_answer(answer.choices[0].message.content)
+
+    async def _process_day(self, date: str, file_path: str, days_path: str):
+        with open(file_path, "r") as file:
+            text = file.read()
+        day_path = os.path.join(days_path, f"{date}.json")
+        key = _hash_day(self.model, text)
+
+        day = _load_json(day_path)
+        if day and day["hash"] == key:
+            self.stats["cached"] += 1
+            return
+
+        start_time = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                intents, analysis = await self.cluster_day(text)
+                break
+            except Exception as error:
+                logger.info(f"{date}: attempt {attempt} failed ({error})")
+                if attempt == self.max_attempts:
+                    self.stats["failed"].append(date)
+                    return
+                self.stats["retried"] += 1
+
+        _save_json(day_path, {"hash": key, "analysis": analysis, **intents})
+        self.stats["done"] += 1
+        logger.info(
+            f"{date}: {len(intents['reactive'])} reactive and "
+            f"{len(intents['proactive'])} proactive intents in "
+            f"{time.perf_counter() - start_time:.2f}s"
+        )
+
+    async def run(
+        self, days: list, save_path: str, start_date: str = "", end_date: str = ""
+    ):
+        """
+        Clusters the intents of the given days. Each day is saved in
+        save_path/days/YYYY-MM-DD.json as soon as it is done, and the intents of
+        the days of the date range are then merged into save_path/reactive.json
+        and save_path/proactive.json.
+
+        Args:
+            days (list): A list of (date, file path) tuples.
+            save_path (str): Directory where the intents are saved.
+            start_date (str): First day merged, in the format YYYY-MM-DD. Default:
+                no lower bound.
+            end_date (str): Last day merged, in the format YYYY-MM-DD. Default: no
+                upper bound.
+
+        Returns:
+            stats (dict): The number of days done, read from the cache and retried,
+                the list of days that failed and the tokens used.
+        """
+        days_path = os.path.join(save_path, "days")
+        os.makedirs(days_path, exist_ok=True)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        await asyncio.gather(
+            *(
+                self._process_day(date, file_path, days_path)
+                for date, file_path in days
+            )
+        )
+        merge_days(save_path, start_date, end_date)
+        return self.stats
+
+
+def merge_days(save_path: str, start_date: str = "", end_date: str = ""):
+    """
+    Merges the intents of each day of the date range saved in save_path/days
+    into the save_path/reactive.json and save_path/proactive.json summaries,
+    which map each date to its intents. The days saved by runs over other dates
+    are left out.
+    """
+    days_path = os.path.join(save_path, "days")
+    merged = {intent_type: {} for intent_type in INTENT_TYPES}
+    for file_name in sorted(os.listdir(days_path)):
+        if not file_name.endswith(".json"):
+            continue
+        date = file_name[: -len(".json")]
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        day = _load_json(os.path.join(days_path, file_name))
+        for intent_type in INTENT_TYPES:
+            merged[intent_type][date] = day[intent_type]
+
+    for intent_type, intents in merged.items():
+        _save_json(os.path.join(save_path, f"{intent_type}.json"), intents)
@@ -0,0 +1,223 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import time
+
+from .catalog import get_catalog
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# disable requests default logging inherent from openai
+httpx_logger = logging.getLogger("httpx")
+httpx_logger.setLevel(logging.WARNING)
+
+DEFAULT_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+SUMMARIZATION_PROMPT = "What interests can you find in the following search records? \n"
+FORMAT_PROMPT = "Summarize the previous answer as a comma-separated array of strings."
+
+
+class ExtractionError(Exception):
+    """Raised when the LLM answer does not contain a list of interests."""
+
+
+def _parse_interests(answer: str):
+    """
+    Extracts the comma-separated array of interests from the LLM answer.
+    """
+    match = re.search(r"\[(.*?)\]", answer, re.DOTALL)
+    if not match:
+        raise ExtractionError(f"Answer does not include an array: {answer}")
+    interests = match.group(1).replace('"', "").replace("'", "").split(",")
+    return [interest.strip() for interest in interests if interest.strip()]
+
+
+def _read_titles(file_path: str):
+    with open(file_path, newline="") as csvfile:
+        return [row["title"] for row in csv.DictReader(csvfile)]
+
+
+def _save_day(save_path: str, date: str, interests: list):
+    # write to a temporary file first, so a day file only exists once complete
+    file_path = os.path.join(save_path, f"{date}.json")
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w") as json_file:
+        json.dump(interests, json_file)
+    os.replace(temp_path, file_path)
+
+
+class InterestsExtractor:
+    """
+    It extracts the interests of each day of search history with an
+    OpenAI-compatible endpoint (e.g. vLLM).
+
+    Days are read by a producer into a bounded queue and processed by a fixed
+    number of consumers, so memory stays flat regardless of the history size.
+    Each day is saved as soon as all its chunks are done, days already saved are
+    skipped, and failed days are processed again, up to a maximum number of
+    attempts.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str = DEFAULT_MODEL,
+        max_concurrency: int = 256,
+        chunk_size: int = 35,
+        max_attempts: int = 3,
+        queue_size: int = 64,
+    ):
+        self.client = client
+        self.model = model
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.queue_size = queue_size
+        self.max_concurrency = max_concurrency
+        self.stats = {"done": 0, "skipped": 0, "failed": [], "retried": 0}
+        # answers of the chunks of failed days, so retries only redo the failures
+        self._chunk_results = {}
+
+    async def _complete(self, messages: list):
+        async with self.semaphore:
+            answer = await self.client.chat.completions.create(
+                model=self.model, messages=messages
+            )
+        return answer.choices[0].message.content
+
+    async def summarize_interests(self, titles: list):
+        """
+        Asks for the interests found in a chunk of search titles, and then for
+        the same answer formatted as an array.
+
+        Returns:
+            interests (list): The interests found in the chunk.
+        """
+        messages = [
+            {"role": "user", "content": SUMMARIZATION_PROMPT + "\n".join(titles)}
+        ]
+        analysis = await self._complete(messages)
+        messages += [
+            {"role": "assistant", "content": analysis},
+            {"role": "user", "content": FORMAT_PROMPT},
+        ]
+        return _parse_interests(await self._complete(messages))
+
+    async def _consume(self, queue: asyncio.Queue, save_path: str, failed: list):
+        while True:
+            date, file_path = await queue.get()
+            try:
+                await self._process_day(date, file_path, save_path)
+            except Exception as error:
+                logger.info(f"{date}: failed ({error})")
+                failed.append((date, file_path))
+            finally:
+                queue.task_done()
+
+    async def _process_day(self, date: str, file_path: str, save_path: str):
+        start_time = time.perf_counter()
+        titles = _read_titles(file_path)
+        chunks = [
+            titles[i : i + self.chunk_size]
+            for i in range(0, len(titles), self.chunk_size)
+        ]
+        missing = [
+            i for i in range(len(chunks)) if (date, i) not in self._chunk_results
+        ]
+        results = await asyncio.gather(
+            *(self.summarize_interests(chunks[i]) for i in missing),
+            return_exceptions=True,
+        )
+        errors = []
+        for i, result in zip(missing, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                self._chunk_results[(date, i)] = result
+        if errors:
+            raise errors[0]
+
+        interests = [
+            interest
+            for i in range(len(chunks))
+            for interest in self._chunk_results.pop((date, i))
+        ]
+        _save_day(save_path, date, interests)
+        self.stats["done"] += 1
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(
+            f"{date}: {len(titles)} searches in {len(chunks)} chunks -> "
+            f"{len(interests)} interests in {elapsed:.2f}s "
+            f"({len(titles) / elapsed:.1f} searches/s)"
+        )
+
+    async def _run_round(self, days: list, save_path: str):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        failed = []
+
+        # Each day runs its chunks concurrently, so a few consumers are enough
+        # to keep max_concurrency requests in flight.
+        consumers = [
+            asyncio.create_task(self._consume(queue, save_path, failed))
+            for _ in range(max(1, self.queue_size // 2))
+        ]
+        for day in days:
+            await queue.put(day)
+        await queue.join()
+
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        return failed
+
+    async def run(self, days: list, save_path: str):
+        """
+        Extracts the interests of the given days.
+
+        Args:
+            days (list): A list of (date, file path) tuples.
+            save_path (str): Directory where each day is saved as YYYY-MM-DD.json.
+
+        Returns:
+            stats (dict): The number of days done, skipped and retried, and the
+                list of days that failed.
+        """
+        os.makedirs(save_path, exist_ok=True)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        pending = []
+        for date, file_path in days:
+            if os.path.exists(os.path.join(save_path, f"{date}.json")):
+                self.stats["skipped"] += 1
+            else:
+                pending.append((date, file_path))
+
+        for attempt in range(1, self.max_attempts + 1):
+            pending = await self._run_round(pending, save_path)
+            if not pending:
+                break
+            if attempt < self.max_attempts:
+                logger.info(f"Retrying {len(pending)} failed days")
+                self.stats["retried"] += len(pending)
+
+        self.stats["failed"] = [date for date, _ in pending]
+        return self.stats
+
+
+def get_days(dir_path: str, start_date: str = "", end_date: str = ""):
+    """
+    Lists the search history files of each day within the date range.
+
+    Returns:
+        days (list): A list of (date, file path) tuples sorted by date.
+    """
+    entries = get_catalog(dir_path).select(
+        kind="raw",
+        start_date=start_date or None,
+        end_date=end_date or None,
+        extension=".csv",
+    )
+    return [(entry["date"], path) for path, entry in entries]
@@ -0,0 +1,236 @@
+import glob
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONVERSATIONS_COLUMNS = ["sender_name", "content", "date", "time"]
+REACTION_DELAY = pd.Timedelta(3, unit="s")
+
+# Meta exports write every UTF-8 byte of a non-ASCII character as its own
+# "\u00XX" escape, which json.load then turns into Latin-1 mojibake. Runs of
+# escapes in the 0x80-0xFF range are always such bytes, so we can rebuild the
+# original characters on the raw text before parsing it.
+_ESCAPED_BYTES_PATTERN = re.compile(r"(?:\\u00[89a-fA-F][0-9a-fA-F])+")
+
+
+def _decode_escaped_bytes(match):
+    escaped = match.group(0)
+    raw_bytes = bytes(
+        int(escaped[i + 4 : i + 6], 16) for i in range(0, len(escaped), 6)
+    )
+    try:
+        return raw_bytes.decode("utf8")
+    except UnicodeDecodeError:
+        # genuine Latin-1 characters, keep them as they are
+        return escaped
+
+
+def fix_encoding(raw_json: str):
+    """
+    Fixes the Latin-1/UTF-8 mojibake of a Meta JSON export in a single pass
+    over the raw text.
+
+    Args:
+        raw_json (str): The content of a message_*.json file.
+
+    Returns:
+        str: The same JSON document with the non-ASCII characters restored.
+    """
+    return _ESCAPED_BYTES_PATTERN.sub(_decode_escaped_bytes, raw_json)
+
+
+def _get_thread_files(export_path: str):
+    """
+    Groups the message_*.json files of an Instagram or Messenger export by
+    inbox thread.
+
+    Returns:
+        threads (dict): thread directory -> sorted list of message files.
+    """
+    threads = defaultdict(list)
+    pattern = os.path.join(export_path, "**", "inbox", "*", "message_*.json")
+    for file_path in glob.glob(pattern, recursive=True):
+        threads[os.path.dirname(file_path)].append(file_path)
+    return {thread: sorted(files) for thread, files in sorted(threads.items())}
+
+
+def _get_username(export_path: str):
+    """
+    Reads the export owner's username from the Instagram personal information
+    file, if present.
+    """
+    pattern = os.path.join(
+        export_path, "**", "personal_information", "personal_information.json"
+    )
+    for file_path in glob.glob(pattern, recursive=True):
+        with open(file_path, "r", encoding="utf8") as json_file:
+            data = json.load(json_file)
+        try:
+            return data["profile_user"][0]["string_map_data"]["Username"]["value"]
+        except (KeyError, IndexError):
+            continue
+    return ""
+
+
+def _read_thread(file_paths: list):
+    participants = []
+    messages = []
+    for file_path in file_paths:
+        with open(file_path, "r", encoding="utf8") as json_file:
+            data = json.loads(fix_encoding(json_file.read()))
+        if not participants:
+            participants = [p["name"] for p in data.get("participants", [])]
+        messages.extend(data.get("messages", []))
+    return participants, messages
+
+
+def _column(frame: pd.DataFrame, name: str):
+    if name in frame:
+        return frame[name]
+    return pd.Series(None, index=frame.index, dtype=object)
+
+
+def _build_content(frame: pd.DataFrame, username: str):
+    """
+    Vectorized version of the notebook's row-wise content rewriting: shares,
+    story reactions and audio messages are replaced by a short description.
+    """
+    content = _column(frame, "content").astype(object)
+
+    share_columns = [column for column in frame if column.startswith("share.")]
+    has_share = (
+        frame[share_columns].notna().any(axis=1)
+        if share_columns
+        else pd.Series(False, index=frame.index)
+    )
+    share_link = _column(frame, "share.link")
+    share_text = _column(frame, "share.share_text")
+
+    shared_content = pd.Series("Shared some content.", index=frame.index)
+    shared_content = shared_content.mask(
+        share_link.notna(), "Shared a link: " + share_link.astype(str)
+    )
+    shared_content = shared_content.mask(
+        share_text.notna(), "Shared: " + share_text.astype(str)
+    )
+    if username:
+        is_story_reaction = share_link.fillna("").str.contains(username, regex=False)
+        shared_content = shared_content.mask(
+            is_story_reaction, "Reacted to your story: " + content.astype(str)
+        )
+
+    content = content.mask(has_share, shared_content)
+    content = content.mask(_column(frame, "audio_files").notna(), "Sent an audio.")
+    return content.fillna("").astype(str)
+
+
+def _build_reactions(frame: pd.DataFrame, user: str, partner: str):
+    """
+    Turns the reactions attached to a message into a new message with the same
+    timestamp (plus a small delay) sent by the other participant.
+    """
+    reactions = _column(frame, "reactions").explode().dropna()
+    if reactions.empty:
+        return pd.DataFrame(columns=["sender_name", "timestamp", "content"])
+
+    reactions = reactions.str.get("reaction").dropna().groupby(level=0).agg(",".join)
+    reacted = frame.loc[reactions.index]
+    return pd.DataFrame(
+        {
+            "sender_name": reacted["sender_name"]
+            .eq(user)
+            .map({True: partner, False: user}),
+            "timestamp": reacted["timestamp"] + REACTION_DELAY,
+            "content": reactions,
+        }
+    )
+
+
+def convert_thread(thread_path: str, file_paths: list, save_path: str, username=""):
+    """
+    Converts every message file of an inbox thread into a single CSV following
+    the conversations schema (sender_name, content, date, time).
+
+    Args:
+        thread_path (str): The inbox thread directory.
+        file_paths (list): The message_*.json files of the thread.
+        save_path (str): Directory to write the CSV file to.
+        username (str): Username of the export owner, used to detect replies
+                        to the owner's stories.
+
+    Returns:
+        messages_count (int): The number of messages written.
+    """
+    participants, messages = _read_thread(file_paths)
+    if not messages or not participants:
+        return 0
+
+    # The export owner is listed last among the participants.
+    user = participants[-1]
+    partner = participants[0]
+
+    frame = pd.json_normalize(messages)
+    frame["timestamp"] = pd.to_datetime(frame["timestamp_ms"], unit="ms")
+    frame["content"] = _build_content(frame, username)
+    frame["sender_name"] = frame["sender_name"].where(
+        frame["sender_name"] != user, "user"
+    )
+
+    reactions = _build_reactions(frame, "user", partner)
+    frame = pd.concat(
+        [frame[["sender_name", "timestamp", "content"]], reactions], ignore_index=True
+    )
+    frame = frame.sort_values("timestamp", kind="stable")
+    frame["date"] = frame["timestamp"].dt.strftime("%Y-%m-%d")
+    frame["time"] = frame["timestamp"].dt.strftime("%H:%M:%S")
+
+    file_name = f"{os.path.basename(thread_path)}.csv"
+    frame[CONVERSATIONS_COLUMNS].to_csv(os.path.join(save_path, file_name), index=False)
+    return len(frame)
+
+
+def _convert_thread_job(args):
+    return convert_thread(*args)
+
+
+def convert_export(export_path: str, save_path: str, username="", workers=None):
+    """
+    Converts an Instagram or Messenger export into conversations CSV files,
+    processing the inbox threads on a process pool.
+
+    Args:
+        export_path (str): Root directory of the unzipped export.
+        save_path (str): Directory to write the CSV files to.
+        username (str): Username of the export owner. Read from the export's
+                        personal information when not provided.
+        workers (int): Number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        threads_count (int): The number of threads converted.
+        messages_count (int): The number of messages written.
+    """
+    threads = _get_thread_files(export_path)
+    username = username or _get_username(export_path)
+    os.makedirs(save_path, exist_ok=True)
+    logger.info(f"Found {len(threads)} inbox threads in {export_path}")
+
+    jobs = [
+        (thread_path, file_paths, save_path, username)
+        for thread_path, file_paths in threads.items()
+    ]
+    if workers == 1:
+        counts = list(map(_convert_thread_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(_convert_thread_job, jobs, chunksize=8))
+
+    threads_count = sum(1 for count in counts if count)
+    return threads_count, sum(counts)
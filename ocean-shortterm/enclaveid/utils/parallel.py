@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    It limits the LLM calls made by all the processes of a run to a number of
+    calls per minute, so that parallel periods share the API quota instead of
+    each hitting the rate limits of the provider.
+
+    It is a token bucket held in shared memory: a call takes a token, and tokens
+    come back at the allowed rate, up to a burst of one second of calls. It must
+    be created before the worker processes and handed to them at their start.
+    """
+
+    def __init__(self, calls_per_minute: float):
+        """
+        Args:
+            calls_per_minute (float): Maximum number of LLM calls per minute.
+        """
+        if calls_per_minute <= 0:
+            raise ValueError("calls_per_minute must be positive.")
+        self.rate = calls_per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self._lock = multiprocessing.Lock()
+        self._tokens = multiprocessing.Value("d", self.capacity, lock=False)
+        self._updated_at = multiprocessing.Value("d", time.time(), lock=False)
+
+    def _take(self):
+        # takes a token if there is one, else returns the seconds until there is
+        with self._lock:
+            now = time.time()
+            tokens = min(
+                self.capacity,
+                self._tokens.value + (now - self._updated_at.value) * self.rate,
+            )
+            self._updated_at.value = now
+            if tokens >= 1:
+                self._tokens.value = tokens - 1
+                return 0.0
+            self._tokens.value = tokens
+        return (1 - tokens) / self.rate
+
+    def acquire(self):
+        """
+        Blocks until a call is allowed.
+        """
+        while True:
+            delay = self._take()
+            if not delay:
+                return
+            time.sleep(delay)
+
+    def try_acquire(self):
+        """
+        Returns whether a call is allowed right away, without waiting.
+        """
+        return not self._take()
+
+
+class CostAccumulator:
+    """
+    It adds up the cost in USD spent by all the processes of a run, and shares
+    the budget of the run among its periods as they start.
+
+    A period gets its share of the budget neither spent nor reserved by the
+    running periods, in proportion to its number of data items, and what it
+    leaves unspent goes back to the periods that have not started yet.
+    """
+
+    def __init__(self, max_cost: float = None, total_items: int = 0):
+        """
+        Args:
+            max_cost (float): Optional budget in USD of the run.
+            total_items (int): The number of data items of all the periods.
+        """
+        self.max_cost = max_cost
+        self._cost = multiprocessing.Value("d", 0.0)
+        # guarded by the lock of the cost
+        self._reserved = multiprocessing.Value("d", 0.0, lock=False)
+        self._remaining_items = multiprocessing.Value("i", total_items, lock=False)
+
+    def reserve(self, items: int):
+        """
+        Reserves the budget of a period that starts, and returns it.
+        """
+        with self._cost.get_lock():
+            budget = 0.0
+            if self._remaining_items.value > 0:
+                budget = max(
+                    0.0,
+                    (self.max_cost - self._cost.value - self._reserved.value)
+                    * items
+                    / self._remaining_items.value,
+                )
+            self._remaining_items.value -= items
+            self._reserved.value += budget
+            return budget
+
+    def add(self, cost: float, reserved: float = 0.0):
+        """
+        Adds a cost, releases the budget reserved for it, and returns the total
+        spent so far.
+        """
+        with self._cost.get_lock():
+            self._cost.value += cost
+            self._reserved.value -= reserved
+            return self._cost.value
+
+    @property
+    def value(self):
+        return self._cost.value
@@ -0,0 +1,140 @@
+import math
+import random
+from collections import defaultdict
+
+from .data_handler import Conversation
+
+# z-value of the 95% confidence interval
+Z_95 = 1.96
+
+
+def get_stratum(item):
+    """
+    Returns the stratum of a data item: its month and, for conversations, its
+    participants, so that every period and every source is represented.
+    """
+    month = item.date.strftime("%Y-%m")
+    if isinstance(item, Conversation):
+        return f"{month}|{','.join(sorted(item.participants))}"
+    return f"{month}|searches"
+
+
+def allocate(sizes: dict, sample_size: int):
+    """
+    Allocates a sample across strata proportionally to their size, using the
+    largest remainder method so the allocations add up to the sample size.
+
+    Args:
+        sizes (dict): stratum -> number of chunks in the stratum.
+        sample_size (int): The total number of chunks to sample.
+
+    Returns:
+        allocation (dict): stratum -> number of chunks to sample from it.
+    """
+    population = sum(sizes.values())
+    if not population:
+        return {}
+    sample_size = min(sample_size, population)
+
+    quotas = {s: size * sample_size / population for s, size in sizes.items()}
+    allocation = {s: math.floor(quota) for s, quota in quotas.items()}
+    remaining = sample_size - sum(allocation.values())
+    by_remainder = sorted(
+        quotas, key=lambda s: (quotas[s] - allocation[s], sizes[s]), reverse=True
+    )
+    for stratum in by_remainder[:remaining]:
+        allocation[stratum] += 1
+    return allocation
+
+
+def sample(strata: dict, sample_size: int, seed: int = 0):
+    """
+    Draws a stratified random sample of chunks.
+
+    Args:
+        strata (dict): stratum -> list of chunks.
+        sample_size (int): The total number of chunks to sample.
+        seed (int): Seed of the random generator, for reproducible samples.
+
+    Returns:
+        chunks (list): The sampled chunks, shuffled across strata so that a run
+            stopped early by its budget still covers the strata evenly.
+    """
+    rng = random.Random(seed)
+    allocation = allocate({s: len(chunks) for s, chunks in strata.items()}, sample_size)
+    sampled = []
+    for stratum in sorted(allocation):
+        sampled.extend(rng.sample(strata[stratum], allocation[stratum]))
+    rng.shuffle(sampled)
+    return sampled
+
+
+def _standard_errors(scores: list):
+    errors = {}
+    for trait in scores[0]:
+        values = [float(score[trait]) for score in scores]
+        mean = sum(values) / len(values)
+        variance = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+        errors[trait] = math.sqrt(variance / len(values))
+    return errors
+
+
+def sampling_error(scores: list, sampling_fraction: float):
+    """
+    Estimates the standard error of the average score of each trait, with the
+    finite population correction for the fraction of chunks sampled.
+
+    Args:
+        scores (list): The scores of each sampled chunk.
+        sampling_fraction (float): The share of chunks that were classified.
+
+    Returns:
+        errors (dict): trait -> {"standard_error", "margin_95"}, or None for all
+            traits when there are fewer than two scores.
+    """
+    if len(scores) < 2:
+        return {trait: None for trait in scores[0]} if scores else {}
+
+    correction = math.sqrt(max(0.0, 1 - sampling_fraction))
+    errors = {}
+    for trait, standard_error in _standard_errors(scores).items():
+        standard_error *= correction
+        errors[trait] = {
+            "standard_error": round(standard_error, 4),
+            "margin_95": round(Z_95 * standard_error, 4),
+        }
+    return errors
+
+
+def confidence_interval_widths(scores: list):
+    """
+    Calculates the width of the 95% confidence interval of the mean score of
+    each trait.
+
+    Args:
+        scores (list): The scores obtained so far.
+
+    Returns:
+        widths (dict): trait -> width of the interval, or infinity when there are
+            fewer than two scores.
+    """
+    if len(scores) < 2:
+        return {trait: math.inf for trait in (scores[0] if scores else {})}
+
+    return {
+        trait: 2 * Z_95 * standard_error
+        for trait, standard_error in _standard_errors(scores).items()
+    }
+
+
+def group_by_stratum(items: list, texts: list):
+    """
+    Groups the formatted data items by stratum, keeping their order.
+
+    Returns:
+        strata (dict): stratum -> list of formatted data items.
+    """
+    strata = defaultdict(list)
+    for item, text in zip(items, texts):
+        strata[get_stratum(item)].append(text)
+    return strata
@@ -0,0 +1,269 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .templates import (
+    DAY_SUMMARY_TEMPLATE,
+    DIRECTIONALITY_TEMPLATE,
+    SUMMARY_REDUCE_TEMPLATE,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Levels of the tree. Days are mapped into summaries, which are then reduced
+# into week, month and lifetime summaries. Above the months, the lifetime is
+# reduced in groups of a fixed fanout until a single root summary is left.
+LEVELS = ["day", "week", "month", "lifetime"]
+
+
+def _hash(*parts: str):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _week_id(date: str):
+    year, week, _ = datetime.strptime(date, "%Y-%m-%d").isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _month_id(week_id: str):
+    # a week belongs to the month of its Thursday, as ISO weeks belong to years
+    thursday = datetime.strptime(f"{week_id}-4", "%G-W%V-%u")
+    return thursday.strftime("%Y-%m")
+
+
+def _join_summaries(node_ids: list, summaries: dict):
+    return "\n\n".join(
+        f"### {node_id}\n{summaries[node_id]['summary']}" for node_id in node_ids
+    )
+
+
+class SummaryTree:
+    """
+    It summarizes a history of days with a tree reduce: days are summarized in
+    parallel, then reduced level by level (day -> week -> month -> lifetime).
+
+    Each node is cached by the hash of the model and of its inputs, i.e. the day
+    text for days and the hashes of the children for the other levels. When a new day is added,
+    only the nodes on its path up to the root have new hashes and are computed,
+    the rest of the tree is read from the cache.
+    """
+
+    def __init__(
+        self,
+        complete,
+        model: str,
+        cache_path: str,
+        workers: int = 8,
+        fanout: int = 12,
+    ):
+        """
+        Args:
+            complete (callable): Takes a prompt and returns the LLM answer.
+            model (str): Name of the model answering, so that the summaries of
+                another model are not read from the cache.
+            cache_path (str): Directory where the node summaries are cached.
+            workers (int): Number of LLM calls made in parallel.
+            fanout (int): Number of children of each node above the months.
+        """
+        self.complete = complete
+        self.model = model
+        self.cache_path = cache_path
+        self.workers = workers
+        self.fanout = fanout
+        self.stats = {"computed": 0, "cached": 0, "failed": []}
+        self._lock = threading.Lock()
+        os.makedirs(cache_path, exist_ok=True)
+
+    def _cache_file(self, key: str):
+        return os.path.join(self.cache_path, key[:2], f"{key}.txt")
+
+    def _get_cached(self, key: str):
+        cache_file = self._cache_file(key)
+        if not os.path.exists(cache_file):
+            return None
+        with open(cache_file, "r") as file:
+            return file.read()
+
+    def _set_cached(self, key: str, summary: str):
+        cache_file = self._cache_file(key)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = f"{cache_file}.tmp"
+        with open(temp_file, "w") as file:
+            file.write(summary)
+        os.replace(temp_file, cache_file)
+
+    def _compute(self, node: dict):
+        summary = self._get_cached(node["key"])
+        if summary is not None:
+            with self._lock:
+                self.stats["cached"] += 1
+            return summary
+
+        try:
+            summary = self.complete(node["prompt"])
+        except Exception as error:
+            logger.info(f"Failed to summarize {node['level']} {node['id']}: {error}")
+            with self._lock:
+                self.stats["failed"].append(f"{node['level']}:{node['id']}")
+            return None
+
+        self._set_cached(node["key"], summary)
+        with self._lock:
+            self.stats["computed"] += 1
+        return summary
+
+    def _run_level(self, nodes: list):
+        """
+        Computes the nodes of a level in parallel.
+
+        Returns:
+            summaries (dict): node id -> {"key", "summary"} for the nodes that
+                succeeded.
+        """
+        if not nodes:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            summaries = list(executor.map(self._compute, nodes))
+        return {
+            node["id"]: {"key": node["key"], "summary": summary}
+            for node, summary in zip(nodes, summaries)
+            if summary is not None
+        }
+
+    def _reduce_level(self, level: str, groups: dict, children: dict, failed: set):
+        """
+        Computes the nodes of a level from their children. A node whose children
+        failed is not computed, so it is never cached with partial inputs, and a
+        node with a single child reuses the summary of its child.
+
+        Returns:
+            summaries (dict): node id -> {"key", "summary"} for the nodes that
+                succeeded.
+        """
+        nodes = []
+        summaries = {}
+        for node_id, child_ids in groups.items():
+            if any(child_id not in children for child_id in child_ids):
+                failed.add(f"{level}:{node_id}")
+                continue
+            if len(child_ids) == 1:
+                summaries[node_id] = children[child_ids[0]]
+                continue
+            keys = [children[child_id]["key"] for child_id in child_ids]
+            nodes.append(
+                {
+                    "id": node_id,
+                    "level": level,
+                    "key": _hash(SUMMARY_REDUCE_TEMPLATE, self.model, level, *keys),
+                    "prompt": SUMMARY_REDUCE_TEMPLATE.format(
+                        level=level, summaries=_join_summaries(child_ids, children)
+                    ),
+                }
+            )
+        summaries.update(self._run_level(nodes))
+        return summaries
+
+    def build(self, days: list):
+        """
+        Summarizes a history of days.
+
+        Args:
+            days (list): A list of (date, text) tuples, with dates in the format
+                         YYYY-MM-DD.
+
+        Returns:
+            tree (dict): The summaries of each level (level -> node id ->
+                {"key", "summary"}), the "root" summary of the whole history, its
+                "directionality" analysis, and the "stats" of the computed,
+                cached, failed and blocked nodes.
+        """
+        tree = {level: {} for level in LEVELS}
+        failed = set()
+
+        day_nodes = [
+            {
+                "id": date,
+                "level": "day",
+                "key": _hash(DAY_SUMMARY_TEMPLATE, self.model, text),
+                "prompt": DAY_SUMMARY_TEMPLATE + text,
+            }
+            for date, text in sorted(days)
+        ]
+        tree["day"] = self._run_level(day_nodes)
+
+        weeks = {}
+        for node in day_nodes:
+            weeks.setdefault(_week_id(node["id"]), []).append(node["id"])
+        tree["week"] = self._reduce_level("week", weeks, tree["day"], failed)
+
+        months = {}
+        for week_id in sorted(weeks):
+            months.setdefault(_month_id(week_id), []).append(week_id)
+        tree["month"] = self._reduce_level("month", months, tree["week"], failed)
+
+        # reduce the months in groups of a fixed fanout until a single node is left
+        node_ids = sorted(months)
+        children = tree["month"]
+        while len(node_ids) > 1:
+            groups = {}
+            for i in range(0, len(node_ids), self.fanout):
+                group = node_ids[i : i + self.fanout]
+                start, end = group[0].split("..")[0], group[-1].split("..")[-1]
+                groups[f"{start}..{end}"] = group
+            children = self._reduce_level("lifetime", groups, children, failed)
+            tree["lifetime"].update(children)
+            node_ids = list(groups)
+
+        if node_ids and node_ids[0] in children and len(tree["month"]) == len(months):
+            month_ids = sorted(months)
+            directionality = self._run_level(
+                [
+                    {
+                        "id": "directionality",
+                        "level": "directionality",
+                        "key": _hash(
+                            DIRECTIONALITY_TEMPLATE,
+                            self.model,
+                            *(tree["month"][month_id]["key"] for month_id in month_ids),
+                        ),
+                        "prompt": DIRECTIONALITY_TEMPLATE.format(
+                            summaries=_join_summaries(month_ids, tree["month"])
+                        ),
+                    }
+                ]
+            )
+            tree["root"] = children[node_ids[0]]
+            tree["directionality"] = directionality.get("directionality")
+
+        tree["stats"] = {**self.stats, "blocked": sorted(failed)}
+        return tree
+
+
+def save_tree(tree: dict, save_path: str):
+    """
+    Saves the summaries of each level as text files: day/YYYY-MM-DD.txt,
+    week/YYYY-Www.txt, month/YYYY-MM.txt, lifetime/<range>.txt and
+    directionality.txt.
+    """
+    for level in LEVELS:
+        level_path = os.path.join(save_path, level)
+        os.makedirs(level_path, exist_ok=True)
+        for node_id, node in tree[level].items():
+            with open(os.path.join(level_path, f"{node_id}.txt"), "w") as file:
+                file.write(node["summary"])
+
+    if tree.get("root"):
+        with open(os.path.join(save_path, "root.txt"), "w") as file:
+            file.write(tree["root"]["summary"])
+
+    if tree.get("directionality"):
+        with open(os.path.join(save_path, "directionality.txt"), "w") as file:
+            file.write(tree["directionality"]["summary"])
@@ -0,0 +1,197 @@
+import csv
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OWNER_NAME = "Me"
+
+# Vocabulary of the synthetic searches and messages. Each topic comes with a few
+# subjects, so that searches and conversations drift between a limited set of
+# interests over time like real ones do.
+TOPICS = {
+    "cooking": ["sourdough starter", "ramen broth", "cast iron pan", "meal prep"],
+    "running": ["marathon training plan", "trail shoes", "interval workouts"],
+    "programming": ["python asyncio", "rust borrow checker", "docker compose"],
+    "travel": ["cheap flights to Lisbon", "Kyoto itinerary", "train pass Europe"],
+    "finance": ["index funds", "mortgage rates", "tax deductions freelancers"],
+    "music": ["guitar chord progressions", "synthesizer presets", "jazz standards"],
+    "health": ["sleep hygiene", "vitamin D dosage", "back pain stretches"],
+    "gaming": ["elden ring builds", "steam deck settings", "chess openings"],
+    "parenting": ["toddler sleep regression", "daycare near me", "baby led weaning"],
+    "career": ["salary negotiation", "resume template", "remote job boards"],
+}
+SEARCH_TEMPLATES = [
+    "Searched for {subject}",
+    "Searched for best {subject} {year}",
+    "Searched for how to {topic} {subject}",
+    "Visited {subject} - Wikipedia",
+    "Visited The ultimate guide to {subject} | {topic} blog",
+    "Watched {subject} explained in 10 minutes",
+]
+MESSAGE_TEMPLATES = [
+    "ok",
+    "haha yes",
+    "sounds good, see you later",
+    "did you see the thing about {subject}?",
+    "I've been reading a lot about {subject} lately",
+    "can we talk about {topic} tomorrow? I have questions about {subject}",
+    "so I finally tried {subject} and honestly it was way harder than I expected, "
+    "I think I need to spend more time on {topic} before trying again",
+]
+CONTACT_NAMES = "Alice Bruno Chloe Dario Emma Farid Greta Hugo Ines Jonas".split()
+
+
+def _get_days(start_date: str, end_date: str):
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    if start > end:
+        raise ValueError("Start date must be before end date.")
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _spread(total: int, weights: list):
+    """
+    Splits total into integer counts proportional to the weights.
+    """
+    weights_sum = sum(weights)
+    counts = [int(total * weight / weights_sum) for weight in weights]
+    remainders = sorted(
+        range(len(weights)),
+        key=lambda i: total * weights[i] / weights_sum - counts[i],
+        reverse=True,
+    )
+    for i in remainders[: total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def _activity_weights(rng: random.Random, days_count: int):
+    # bursty activity: the interest of a day follows the previous days, with a
+    # heavy tail of very active days and some days without any activity
+    weights = []
+    level = 1.0
+    for _ in range(days_count):
+        level = 0.8 * level + 0.2 * rng.lognormvariate(0, 1)
+        weights.append(0.0 if rng.random() < 0.1 else level)
+    return weights
+
+
+def _fill(rng: random.Random, template: str, topic: str, year: int):
+    return template.format(topic=topic, subject=rng.choice(TOPICS[topic]), year=year)
+
+
+def _random_times(rng: random.Random, count: int):
+    # active hours are mostly between 8:00 and 24:00
+    seconds = sorted(int(rng.uniform(8, 24) * 3600) for _ in range(count))
+    return [
+        f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}"
+        for second in seconds
+    ]
+
+
+def generate_searches(
+    save_path: str, searches_count: int, start_date: str, end_date: str, seed=0
+):
+    """
+    Writes a synthetic search history as one YYYY-MM-DD.csv file per active day,
+    with the "hour" and "title" columns expected by the searches data type.
+
+    Args:
+        save_path (str): Directory of the CSV files.
+        searches_count (int): Total number of searches.
+        start_date (str): First day, in the format YYYY-MM-DD.
+        end_date (str): Last day, in the format YYYY-MM-DD.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        files_count (int): The number of files written.
+    """
+    rng = random.Random(seed)
+    days = _get_days(start_date, end_date)
+    counts = _spread(searches_count, _activity_weights(rng, len(days)))
+    topics = list(TOPICS)
+    os.makedirs(save_path, exist_ok=True)
+
+    files_count = 0
+    topic = rng.choice(topics)
+    for day, count in zip(days, counts):
+        if not count:
+            continue
+        with open(
+            os.path.join(save_path, f"{day.strftime('%Y-%m-%d')}.csv"), "w", newline=""
+        ) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["hour", "title"])
+            for hour in _random_times(rng, count):
+                # searches come in sessions on the same topic
+                if rng.random() < 0.2:
+                    topic = rng.choice(topics)
+                title = _fill(rng, rng.choice(SEARCH_TEMPLATES), topic, day.year)
+                writer.writerow([hour, title])
+        files_count += 1
+
+    logger.info(f"Wrote {searches_count} searches in {files_count} files.")
+    return files_count
+
+
+def generate_conversations(
+    save_path: str,
+    messages_count: int,
+    start_date: str,
+    end_date: str,
+    contacts_count: int = 50,
+    seed=0,
+):
+    """
+    Writes synthetic chats as one CSV file per contact, with the "sender_name",
+    "content", "date" and "time" columns expected by the conversations data type.
+    A few contacts get most of the messages, as in real chat exports.
+
+    Args:
+        save_path (str): Directory of the CSV files.
+        messages_count (int): Total number of messages.
+        start_date (str): First day, in the format YYYY-MM-DD.
+        end_date (str): Last day, in the format YYYY-MM-DD.
+        contacts_count (int): Number of contacts, i.e. of files.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        files_count (int): The number of files written.
+    """
+    rng = random.Random(seed)
+    days = _get_days(start_date, end_date)
+    topics = list(TOPICS)
+    os.makedirs(save_path, exist_ok=True)
+
+    # Zipf-like share of the messages per contact
+    per_contact = _spread(
+        messages_count, [1 / rank for rank in range(1, contacts_count + 1)]
+    )
+    files_count = 0
+    for index, count in enumerate(per_contact):
+        if not count:
+            continue
+        contact = f"{CONTACT_NAMES[index % len(CONTACT_NAMES)]} {index}"
+        per_day = _spread(count, _activity_weights(rng, len(days)))
+        with open(
+            os.path.join(save_path, f"chat_{index:04d}.csv"), "w", newline=""
+        ) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["sender_name", "content", "date", "time"])
+            topic = rng.choice(topics)
+            for day, day_count in zip(days, per_day):
+                date = day.strftime("%Y-%m-%d")
+                for time in _random_times(rng, day_count):
+                    if rng.random() < 0.1:
+                        topic = rng.choice(topics)
+                    sender = OWNER_NAME if rng.random() < 0.5 else contact
+                    content = _fill(rng, rng.choice(MESSAGE_TEMPLATES), topic, day.year)
+                    writer.writerow([sender, content, date, time])
+        files_count += 1
+
+    logger.info(f"Wrote {messages_count} messages in {files_count} files.")
+    return files_count
@@ -1,3 +1,6 @@
+# The variable parts of the OCEAN prompts (the chunk text and its labels) go last,
+# so that every call with the same template shares a byte-identical prefix that
+# provider-side prompt caching and vLLM prefix caching can reuse.
 SCORE_TEMPLATE = """
 Role: Psychologist specializing in OCEAN personality traits.
 
@@ -12,14 +15,12 @@ Score Range:
 - Use a score of 0.5 for traits that are neutral or not evident in the text.
 
 Task Procedure:
-1- Review Pre-Assigned Levels: Examine the initial intensity levels for each OCEAN trait: {labels}.
+1- Review Pre-Assigned Levels: Examine the initial intensity levels for each OCEAN trait, given below with the text.
 2- Adjust Levels: Critically analyze these levels and correct them if they don't accurately represent the traits as \
 depicted in the text.
 3- Quantify Traits: After adjusting the qualitative levels, calculate and assign a numerical score between 0.0 and 1.0 \
 for each trait. These scores should reflect your revised assessment and the context and content of the text.
 
-Text for Analysis: <<< {text} >>>
-
 Output Format: format your response as a JSON object, using the trait names as keys (openness, conscientiousness, \
 extraversion, agreeableness, and neuroticism') and the assigned level score as values.
 
@@ -39,6 +40,10 @@ Perform the Task. Begin by thinking step by step and following the described Tas
 you answer, specifially the rationale behind the assigned trait scores, with an in-depth explanation of why specific score values were assigned to each trait.
 Elaborate on the particular elements in the Text for Analysis that influenced the decision for each score value, clarifying the reasoning and \
 thought process behind these evaluations.
+
+Pre-Assigned Levels: {labels}
+
+Text for Analysis: <<< {text} >>>
 """
 
 CLASSIFICATION_TEMPLATE_SRCH = """
@@ -68,8 +73,6 @@ Content Consideration:
 - Focus on searches that demonstrate planning, organization, and diligence for assessing Openness and Conscientiousness. \
 - Avoid assuming a base level of these traits due to the nature of the data (search histories).
 
-Text: <<< {text} >>>
-
 Trait Positive and Negative Marker Indicators: {markers}
 
 Output Format: format your response as a JSON object, using the trait names as keys and the assigned levels as values.
@@ -90,6 +93,8 @@ Perform the Task. Begin by thinking step by step and following the described Tas
 you answer, specifially the rationale behind the assigned trait levels, with an in-depth explanation of why a specific level was assigned to each trait.
 Elaborate on the particular elements in the Text for Analysis that influenced the decision for each trait level, clarifying the reasoning and \
 thought process behind these classifications.
+
+Text: <<< {text} >>>
 """
 
 CLASSIFICATION_TEMPLATE_CONV = """
@@ -116,8 +121,6 @@ Intensity Levels:
 - Low: The trait is barely noticeable, with very few indications of its presence.
 - None: There is no indication of the trait at all; it is completely absent.
 
-Text: <<< {text} >>>
-
 Trait Markers: {markers}
 
 Output Format: format your response as a JSON object, using the trait names as keys and the assigned levels as values.
@@ -138,4 +141,144 @@ Perform the Task. Begin by thinking step by step and following the described Tas
 you answer, specifially the rationale behind the assigned trait levels, with an in-depth explanation of why a specific level was assigned to each trait.
 Elaborate on the particular elements in the Text for Analysis that influenced the decision for each trait level, clarifying the reasoning and \
 thought process behind these classifications.
+
+Text: <<< {text} >>>
+"""
+
+CLASSIFY_AND_SCORE_TEMPLATE = """
+Role: Psychologist specializing in OCEAN personality traits.
+
+Task: Analyze the OCEAN personality traits (Openness, Conscientiousness, Extraversion, Agreeableness, Neuroticism) of 'user' \
+in the provided text (enclosed within <<< >>>), which is either a series of concatenated chat conversations between 'user' \
+and various individuals or the concatenated titles of the user's search history. Classify the intensity level of each trait \
+and assign it a quantitative score in a single answer.
+
+Task Procedure:
+1- Detailed Review: Examine the complete text within <<< >>>, focusing on the messages sent by 'user' or on the titles \
+searched or visited by the user.
+2- Classify Levels: Assess the intensity of each OCEAN trait, considering the content and context of the text. Identify \
+specific indicators that correspond to each trait, both positive and negative, ensuring an unbiased evaluation.
+3- Quantify Traits: Assign each trait a score between 0.0 (lowest) and 1.0 (highest) that is consistent with its level. \
+Use a score of 0.5 for traits that are neutral or not evident in the text.
+
+Intensity Levels:
+- High: The trait is very noticeable. It is expressed often and in a detailed manner.
+- Medium: The trait is somewhat noticeable, but the expressions of it are limited.
+- Low: The trait is barely noticeable, with very few indications of its presence.
+- None: There is no indication of the trait at all; it is completely absent.
+
+Trait Positive and Negative Marker Indicators: {markers}
+
+Output Format: format your response as a single JSON object with the keys "explanation", "labels" and "scores". \
+"explanation" is a brief rationale of the assigned levels and scores, "labels" and "scores" use the trait names as keys \
+(openness, conscientiousness, extraversion, agreeableness, neuroticism).
+
+Expected JSON Output Format:
+{{
+    "explanation": "[rationale]",
+    "labels": {{
+        "openness": "[level]",
+        "conscientiousness": "[level]",
+        "extraversion": "[level]",
+        "agreeableness": "[level]",
+        "neuroticism": "[level]"
+    }},
+    "scores": {{
+        "openness": [score],
+        "conscientiousness": [score],
+        "extraversion": [score],
+        "agreeableness": [score],
+        "neuroticism": [score]
+    }}
+}}
+
+- Replace "[level]" with the appropriate level (high, medium, low, none) and "[score]" with the calculated score.
+- Ensure that the response strictly adheres to the JSON format specified.
+
+Text: <<< {text} >>>
+"""
+
+DAY_SUMMARY_TEMPLATE = """
+Here is a list of Google search history records for a given day.
+What can you guess about the user? What is the user's intent behind the main sessions?
+
+At the end of your analysis, provide a JSON object categorizing the day with any of these broad category tags that apply to the activities:
+[
+  "science",
+  "arts and culture",
+  "organization and planning",
+  "goal-setting and self-improvement",
+  "educational content",
+  "random browsing and procrastination",
+  "entertainment-focused",
+  "social/extroverted activities",
+  "solitary/introspective content",
+  "solo hobbies",
+  "helping others and charity work",
+  "empathy and emotional intelligence",
+  "relationships",
+  "competitive content",
+  "critical content",
+  "individual success",
+  "anxiety",
+  "stress management and coping mechanisms",
+  "health-related concerns",
+  "relaxation content",
+  "well-being/positivity"
+]
+
+Additionally, add a field that contains a more fine-grained set of interests that you can infer from the data.
+The final result should look something like this:
+{
+  "broad_categories": [
+    "science",
+    "arts and culture",
+    "educational content",
+    "random browsing and procrastination",
+    "critical content",
+    "individual success"
+  ],
+  "narrow_interests": [
+    "U2 rock band",
+    "Javascript programming"
+  ]
+}
+
+Make sure to only use the provided tags for the "broad_categories" field.
+"""
+
+SUMMARY_REDUCE_TEMPLATE = """
+Here are the analyses of the Google search history of a user over consecutive periods of time, \
+each one introduced by its period.
+
+Consolidate them into a single analysis for the whole {level}: what can you guess about the user, \
+what were their main intents and how did they change along the periods?
+
+At the end of your analysis, provide a JSON object with the fields "broad_categories" and \
+"narrow_interests", merging the ones of the analyses and keeping only the most relevant ones. \
+Make sure to only use the broad category tags used in the analyses.
+
+{summaries}
+"""
+
+DIRECTIONALITY_TEMPLATE = """
+Here are the monthly analyses of the Google search history of a user, in chronological order, \
+each one introduced by its month.
+
+Describe the directionality of the user's interests and intents over time: which ones appeared, \
+grew, faded or stayed stable, and which long-term goals or changes in personality they suggest.
+
+{summaries}
+"""
+
+INTENT_CLUSTERING_TEMPLATE = """
+Here is some recent google search activity. What is the user doing throughout the day?
+
+Cluster the activity into topics, then classify each topic either as a proactive intent (endogenous, proactive \
+knowledge seeking, long term) or as a reactive intent (exogenous, reactive knowledge seeking, short term).
+
+Format your answer as a JSON object with the fields: analysis, reactive, proactive. The "analysis" field is a \
+string where you describe what the user is doing throughout the day before classifying the topics. The type of the \
+"reactive" and "proactive" fields is an array with items with fields: title, description, time_start, time_end.
+
 """